@@ -67,6 +67,11 @@ CREATE TABLE IF NOT EXISTS locked_channels
     unlock_at TIMESTAMP
 );
 
+CREATE TABLE IF NOT EXISTS server_locked_channels
+(
+    id BIGINT PRIMARY KEY
+);
+
 CREATE TABLE IF NOT EXISTS youtubers
 (
     id               BIGINT PRIMARY KEY,
@@ -76,6 +81,13 @@ CREATE TABLE IF NOT EXISTS youtubers
     times_advertised INT DEFAULT 0
 );
 
+CREATE TABLE IF NOT EXISTS youtube_announcements
+(
+    id        BIGINT PRIMARY KEY REFERENCES youtubers (id) ON DELETE CASCADE,
+    video_id  TEXT      NOT NULL,
+    queued_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
 CREATE TABLE IF NOT EXISTS promocodes
 (
     code       VARCHAR(8) PRIMARY KEY,
@@ -90,6 +102,16 @@ CREATE TABLE IF NOT EXISTS promo_notifications
     UNIQUE (id, score)
 );
 
+CREATE INDEX IF NOT EXISTS warns_target_id_idx ON warns (target_id, rule_violated);
+
+CREATE INDEX IF NOT EXISTS warns_issued_at_idx ON warns (issued_at);
+
+CREATE INDEX IF NOT EXISTS temproles_remove_at_idx ON temproles (remove_at);
+
+CREATE INDEX IF NOT EXISTS bans_unban_at_idx ON bans (unban_at) WHERE unban_at IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS locked_channels_unlock_at_idx ON locked_channels (unlock_at) WHERE unlock_at IS NOT NULL;
+
 CREATE TABLE IF NOT EXISTS version
 (
     id      SMALLINT PRIMARY KEY,
@@ -97,5 +119,5 @@ CREATE TABLE IF NOT EXISTS version
 );
 
 INSERT INTO version (id, version)
-VALUES (0, 3)
+VALUES (0, 6)
 ON CONFLICT DO NOTHING;
@@ -2,12 +2,13 @@ import asyncio
 from contextlib import redirect_stdout
 from io import StringIO
 
-import asyncpg
 import disnake
 from disnake.ext import commands
 
+from utils.checks import is_staff
 from utils.cog import Cog
 from utils.constants import APPLICATIONS_CHANNEL_ID, GUILD_ID
+from utils.embeds import BaseEmbed
 from utils.enums import FetchMode
 from utils.views import ApplicationsView
 
@@ -51,11 +52,11 @@ asyncio.run_coroutine_threadsafe(asyncf(), asyncio.get_running_loop())"""
 
     @commands.Cog.listener("on_member_join")
     async def remove_left(self, member: disnake.Member):
-        await self.bot.db.execute("UPDATE scores SET left_server = false WHERE id = $1", member.id)
+        await self.bot.db.set_left_server(member.id, False)
 
     @commands.Cog.listener("on_member_remove")
     async def add_left(self, member: disnake.Member):
-        await self.bot.db.execute("UPDATE scores SET left_server = true WHERE id = $1", member.id)
+        await self.bot.db.set_left_server(member.id, True)
 
     @commands.slash_command(
         name="scanleftmembers",
@@ -70,12 +71,7 @@ asyncio.run_coroutine_threadsafe(asyncf(), asyncio.get_running_loop())"""
             for r in await self.bot.db.execute("SELECT id FROM scores WHERE NOT left_server", fetch_mode=FetchMode.ALL)
         }
         left_members = db_members - all_actual_members
-        async with self.bot.db.pool.acquire() as con:
-            con: asyncpg.Connection
-            await con.executemany(
-                "UPDATE scores SET left_server = TRUE WHERE id = $1",
-                [(i,) for i in left_members],
-            )
+        await self.bot.db.mark_left_members(left_members)
         await inter.send(f"Successfully marked **{len(left_members)} members** as left")
 
     @commands.slash_command(name="setupappl", description="Setups applications")
@@ -86,3 +82,63 @@ asyncio.run_coroutine_threadsafe(asyncf(), asyncio.get_running_loop())"""
             view=ApplicationsView(),
         )
         await inter.send("Done", ephemeral=True)
+
+
+class Diagnostics(Cog):
+    async def cog_slash_command_check(self, inter: disnake.ApplicationCommandInteraction) -> bool:
+        return await is_staff(self.bot, inter)
+
+    @commands.slash_command(name="dbstats", description="Shows database pool and query statistics")
+    async def dbstats(self, inter: disnake.ApplicationCommandInteraction):
+        metrics = self.bot.db.metrics
+        pool = self.bot.db.pool
+        idle = pool.get_idle_size()
+        acquire = metrics.acquire
+        embed = BaseEmbed(inter.user, title="Database statistics", color=0x00FFFF).add_field(
+            "Pool",
+            f"**In use:** `{pool.get_size() - idle}`\n**Idle:** `{idle}`\n"
+            f"**Max size:** `{pool.get_max_size()}`\n"
+            f"**Acquire p50/p99:** `{acquire.quantile(0.5) * 1000:g}ms` / `{acquire.quantile(0.99) * 1000:g}ms`",
+            inline=False,
+        )
+        cache = self.bot.db.cache.stats()
+        lookups = cache["hits"] + cache["misses"]
+        embed.add_field(
+            "Cache",
+            f"**Size:** `{cache['size']}`\n**Hits:** `{cache['hits']}`\n**Misses:** `{cache['misses']}`\n"
+            f"**Hit rate:** `{cache['hits'] / lookups * 100 if lookups else 0:.1f}%`",
+            inline=False,
+        )
+        slowest = sorted(metrics.queries.items(), key=lambda x: x[1].quantile(0.99), reverse=True)[:10]
+        embed.add_field(
+            "Slowest queries (p50 / p99, calls, errors)",
+            "\n".join(
+                f"`{name}` {h.quantile(0.5) * 1000:g}ms / {h.quantile(0.99) * 1000:g}ms, "
+                f"{h.count}, {metrics.errors.get(name, 0)}"
+                for name, h in slowest
+            )
+            or "No queries yet",
+            inline=False,
+        )
+        await inter.send(embed=embed, ephemeral=True)
+
+    @commands.slash_command(name="perfstats", description="Shows event loop lag and slowest handlers")
+    async def perfstats(self, inter: disnake.ApplicationCommandInteraction):
+        monitor = self.bot.loop_monitor
+        embed = BaseEmbed(inter.user, title="Performance statistics", color=0x00FFFF).add_field(
+            "Event loop",
+            f"**Lag p50/p99:** `{monitor.lag.quantile(0.5) * 1000:.1f}ms` / `{monitor.lag.quantile(0.99) * 1000:.1f}ms`"
+            f"\n**Stalls:** `{monitor.stalls}`",
+            inline=False,
+        )
+        slowest = sorted(self.bot.profiler.stats.items(), key=lambda x: x[1].quantile(0.99), reverse=True)[:10]
+        embed.add_field(
+            "Slowest handlers (p50 / p99, calls)",
+            "\n".join(
+                f"`{name}` {s.quantile(0.5) * 1000:.1f}ms / {s.quantile(0.99) * 1000:.1f}ms, {s.count}"
+                for name, s in slowest
+            )
+            or "No handlers ran yet",
+            inline=False,
+        )
+        await inter.send(embed=embed, ephemeral=True)
@@ -6,7 +6,7 @@ import disnake
 from disnake.ext import commands, tasks
 from tabulate import tabulate
 
-from utils.bot import Bot
+from utils.bot import Bot, MessageContext, message_stage
 from utils.cog import Cog
 from utils.constants import (
     PROMOCODE_CHANNEL_ID,
@@ -14,11 +14,12 @@ from utils.constants import (
     PROMOCODE_REQUIRED_SCORE,
     XP_BOUNDS,
     XP_COOLDOWN_SECONDS,
+    XP_FLUSH_INTERVAL_SECONDS,
     XP_IGNORED_CHANNELS_IDS,
 )
 from utils.converters import DateConverter
+from utils.datamodels import LevelRoles
 from utils.embeds import SuccessEmbed
-from utils.enums import FetchMode
 from utils.errors import AdminOnly
 from utils.image_generator import draw_leaderboard, draw_rank_card
 from utils.utils import get_next_score, sep_num
@@ -32,59 +33,49 @@ class Levels(Cog):
         # keys are channel IDs and values are ID of last member that sent the message
         self.last_messages: dict[int, int] = {}
 
+        # level of each member at their last role check, valid only for the level table it was computed with
+        self.member_levels: dict[int, int] = {}
+        self._level_table: LevelRoles | None = None
+
         self.cooldowns_cleaner.start()
+        self.scores_flusher.start()
 
     def _is_member_on_cooldown(self, member_id: int) -> bool:
         return member_id in self.cooldowns and self.cooldowns[member_id] > datetime.now()
 
-    async def _check_level_roles(self, member: disnake.Member, channel: disnake.TextChannel):
-        score = await self.bot.db.get_users_score(member.id)
-        levels = await self.bot.db.get_level_roles()
-        all_roles = set(levels.values())
-        required_roles = {v for k, v in levels.items() if k < score}
-        unearned_roles = all_roles - required_roles
+    async def _check_level_roles(self, member: disnake.Member, channel: disnake.TextChannel, score: int):
+        levels = await self.bot.db.get_level_table()
+        # the table is rebuilt whenever its cache entry expires, so it is compared by value
+        if levels != self._level_table:
+            self._level_table = levels
+            self.member_levels.clear()
+        level = levels.level(score)
+        if self.member_levels.get(member.id) == level:
+            return
+
         current_roles = {r.id for r in member.roles}
-        roles_to_add = required_roles - current_roles
-        roles_to_remove = unearned_roles & current_roles
-        if len(roles_to_add) > 0:
-            await member.add_roles(*[disnake.Object(i) for i in roles_to_add])
-            top_role = levels[max(filter(lambda x: score >= x, levels))]
-            if top_role in roles_to_add:
-                await channel.send(
-                    f"GG {member.mention}, you just earned <@&{top_role}>!",
-                    allowed_mentions=disnake.AllowedMentions.none(),
-                )
-        if len(roles_to_remove) > 0:
-            await member.remove_roles(*[disnake.Object(i) for i in roles_to_remove])
+        target_roles = levels.targets[level]
+        roles_to_add = target_roles - current_roles
+        roles_to_remove = (levels.all_roles - target_roles) & current_roles
+        if len(roles_to_add) > 0 or len(roles_to_remove) > 0:
+            await member.edit(
+                roles=[r for r in member.roles if not r.is_default() and r.id not in roles_to_remove]
+                + [disnake.Object(i) for i in roles_to_add]
+            )
+        self.member_levels[member.id] = level
 
-    async def _check_promocodes(self, member: disnake.Member, channel: disnake.TextChannel):
-        weekly_score = (
-            await self.bot.db.execute(
-                "SELECT score_weekly FROM scores WHERE id = $1",
-                member.id,
-                fetch_mode=FetchMode.VAL,
+        if level > 0 and levels.roles[level - 1] in roles_to_add:
+            await channel.send(
+                f"GG {member.mention}, you just earned <@&{levels.roles[level - 1]}>!",
+                allowed_mentions=disnake.AllowedMentions.none(),
             )
-            or 0
-        )
+
+    async def _check_promocodes(self, member: disnake.Member, channel: disnake.TextChannel):
+        weekly_score = await self.bot.db.get_users_weekly_score(member.id)
         required_notifications = set(filter(lambda x: x <= weekly_score, PROMOCODE_NOTIFICATIONS))
-        done_notifications = set(
-            [
-                r["score"]
-                for r in await self.bot.db.execute(
-                    "SELECT score FROM promo_notifications WHERE id = $1",
-                    member.id,
-                    fetch_mode=FetchMode.ALL,
-                )
-            ]
-        )
-        required_notifications -= done_notifications
+        required_notifications -= await self.bot.db.get_promo_notifications(member.id)
         if len(required_notifications) > 0:
-            for score in required_notifications:
-                await self.bot.db.execute(
-                    "INSERT INTO promo_notifications (id, score) VALUES ($1, $2) ON CONFLICT DO NOTHING",
-                    member.id,
-                    score,
-                )
+            await self.bot.db.add_promo_notifications(member.id, required_notifications)
             if weekly_score < PROMOCODE_REQUIRED_SCORE:
                 await channel.send(
                     f"{member.mention}, you just hit **{max(required_notifications)}** weekly score! "
@@ -102,6 +93,10 @@ class Levels(Cog):
         self.last_messages[msg.channel.id] = msg.author.id
         return is_last
 
+    @Cog.listener("on_member_remove")
+    async def level_forgetter(self, member: disnake.Member):
+        self.member_levels.pop(member.id, None)
+
     @tasks.loop(minutes=10)
     async def cooldowns_cleaner(self):
         now = datetime.now()
@@ -109,21 +104,30 @@ class Levels(Cog):
             if dt < now:
                 del self.cooldowns[id]
 
-    @Cog.listener("on_message")
-    async def xp_controller(self, message: disnake.Message):
+    @tasks.loop(seconds=XP_FLUSH_INTERVAL_SECONDS)
+    async def scores_flusher(self):
+        # failed deltas are restored to the buffer, so they are retried on the next tick
+        try:
+            await self.bot.db.flush_scores()
+        except Exception as e:
+            self.bot.log.error("Failed to flush scores", exc_info=e)
+
+    @message_stage(40)
+    async def xp_controller(self, ctx: MessageContext):
+        message = ctx.message
         if (
-            isinstance(message.author, disnake.User)
-            or message.author.bot
-            or message.channel.id in XP_IGNORED_CHANNELS_IDS
-            or message.channel.category_id in XP_IGNORED_CHANNELS_IDS
+            ctx.member is None
+            or ctx.is_bot
+            or ctx.channel_id in XP_IGNORED_CHANNELS_IDS
+            or ctx.category_id in XP_IGNORED_CHANNELS_IDS
             or self._is_last_member(message)
             or self._is_member_on_cooldown(message.author.id)
         ):
             return
 
         self.cooldowns[message.author.id] = datetime.now() + timedelta(seconds=XP_COOLDOWN_SECONDS)
-        await self.bot.db.update_users_score(message.author.id, random.randint(*XP_BOUNDS))
-        await self._check_level_roles(message.author, message.channel)
+        score = await self.bot.db.update_users_score(message.author.id, random.randint(*XP_BOUNDS))
+        await self._check_level_roles(message.author, message.channel, score)
         if await self.bot.db.promocodes_present():
             await self._check_promocodes(message.author, message.channel)
 
@@ -133,17 +137,13 @@ class Levels(Cog):
         await inter.response.defer()
         user = user or inter.user
         levels = await self.bot.db.get_level_roles()
-        current_score = await self.bot.db.get_users_score(user.id)
-        score_daily, score_weekly = await self.bot.db.execute(
-            "SELECT score_daily, score_weekly FROM scores WHERE id = $1",
-            user.id,
-            fetch_mode=FetchMode.ROW,
-        )
+        score = await self.bot.db.get_score(user.id)
+        current_score = score.total
         next_score = get_next_score(current_score, levels.keys())
         next_role = inter.guild.get_role(levels[next_score]) if next_score is not None else None
 
         await inter.send(
-            f"Daily score: **{score_daily:,}**\nWeekly score: **{score_weekly:,}**",
+            f"Daily score: **{score.daily:,}**\nWeekly score: **{score.weekly:,}**",
             file=disnake.File(
                 f := await draw_rank_card(
                     user,
@@ -159,7 +159,7 @@ class Levels(Cog):
 
     @commands.slash_command(name="leaderboard", description="Displays user's leaderboard")
     @commands.cooldown(1, 15, commands.BucketType.user)
-    async def leaderboard(self, inter: disnake.ApplicationCommandInteraction, page: int = 1):
+    async def leaderboard(self, inter: disnake.ApplicationCommandInteraction, page: int = commands.Param(1, ge=1)):
         await inter.response.defer()
         await inter.send(file=disnake.File(f := await draw_leaderboard(self.bot, page), filename="leaderboard.png"))
         f.close()
@@ -280,13 +280,7 @@ class LevelsManagement(Cog):
             await inter.send("The unlock date can't be past expire date", ephemeral=True)
             return
         try:
-            await self.bot.db.execute(
-                "INSERT INTO promocodes (code, expires_at, unlocks_at) VALUES ($1, $2, $3)",
-                promocode,
-                expires_at,
-                unlocks_at,
-            )
-            self.bot.db.invalidate_promocodes()
+            await self.bot.db.add_promocode(promocode, expires_at, unlocks_at)
         except asyncpg.UniqueViolationError:
             await inter.send("This promocode is already added!", ephemeral=True)
             return
@@ -297,6 +291,5 @@ class LevelsManagement(Cog):
     async def removepromo(
         self, inter: disnake.ApplicationCommandInteraction, promocode: str = commands.Param(min_length=8, max_length=8)
     ):
-        await self.bot.db.execute("DELETE FROM promocodes WHERE code = $1", promocode)
-        self.bot.db.invalidate_promocodes()
+        await self.bot.db.remove_promocode(promocode)
         await inter.send("Successfully removed this promocode!", ephemeral=True)
@@ -2,7 +2,7 @@ from datetime import datetime, timedelta
 
 import disnake
 
-from utils.bot import Bot
+from utils.bot import Bot, MessageContext, message_stage
 from utils.cog import Cog
 from utils.constants import (
     COUNTING_CHANNEL_ID,
@@ -13,7 +13,6 @@ from utils.constants import (
     WELCOME_CHANNEL_ID,
 )
 from utils.embeds import ErrorEmbed
-from utils.enums import FetchMode
 from utils.utils import ordinal_num
 
 
@@ -28,11 +27,12 @@ class MessageListeners(Cog):
             self._filemuted_role = self.bot.server.get_role(FILEMUTED_ROLE_ID)
         return self._filemuted_role
 
-    @Cog.listener("on_message")
-    async def filemuted_controller(self, message: disnake.Message):
-        if isinstance(message.author, disnake.User):
-            return
-        if self.filemuted_role in message.author.roles and len(message.attachments) > 0:
+    @message_stage(10)
+    async def filemuted_controller(self, ctx: MessageContext) -> bool:
+        message = ctx.message
+        if ctx.member is None:
+            return False
+        if len(message.attachments) > 0 and self.filemuted_role in ctx.member.roles:
             await message.delete()
             await message.channel.send(
                 embed=ErrorEmbed(
@@ -41,6 +41,8 @@ class MessageListeners(Cog):
                 ),
                 delete_after=3,
             )
+            return True
+        return False
 
     @Cog.listener("on_message_delete")
     async def deleted_messages_log(self, message: disnake.Message):
@@ -61,31 +63,31 @@ class MessageListeners(Cog):
             files=[await a.to_file() for a in message.attachments],
         )
 
-    @Cog.listener("on_message")
-    async def content_checker(self, message: disnake.Message):
-        if message.author.bot or message.author.guild_permissions.manage_guild:
-            return
+    @message_stage(20)
+    async def content_checker(self, ctx: MessageContext) -> bool:
+        message = ctx.message
+        if ctx.is_bot or ctx.member is None or ctx.is_admin:
+            return False
 
-        if message.channel.id == HU_CHANNEL_ID and message.content.lower() != "hu":
+        if ctx.channel_id == HU_CHANNEL_ID and message.content.lower() != "hu":
             await message.delete()
             await message.channel.send(f"{message.author.mention} hu only!", delete_after=3)
 
-        elif (
-            message.channel.id == COUNTING_CHANNEL_ID and not disnake.utils.remove_markdown(message.content).isnumeric()
-        ):
+        elif ctx.channel_id == COUNTING_CHANNEL_ID and not disnake.utils.remove_markdown(message.content).isnumeric():
             await message.delete()
             await message.channel.send(f"{message.author.mention} numbers only!", delete_after=3)
 
-        elif any(
-            r["code"] in message.clean_content.upper()
-            for r in await self.bot.db.execute("SELECT code FROM promocodes", fetch_mode=FetchMode.ALL)
-        ):
+        elif await self.bot.db.find_promocode(message.clean_content.upper()) is not None:
             await message.delete()
             await message.author.timeout(duration=timedelta(hours=6), reason="Posted valid promocode")
             await message.channel.send(
                 f"{message.author.mention} I warned you about consequences didn't I? Don't leak promocodes 🙏"
             )
 
+        else:
+            return False
+        return True
+
 
 class MembersListeners(Cog):
     @Cog.listener("on_member_join")
@@ -6,6 +6,7 @@ from disnake.ext import commands
 from strmath import evaluate
 
 from utils.autocomplete import rules_autocomplete
+from utils.bot import MessageContext, message_stage
 from utils.checks import staff_only
 from utils.cog import Cog
 from utils.converters import RuleConverter
@@ -16,9 +17,10 @@ from utils.views import ConfirmationView
 
 
 class Miscellaneous(Cog):
-    @Cog.listener("on_message")
-    async def afk_controller(self, message: disnake.Message):
-        if message.author.bot:
+    @message_stage(30)
+    async def afk_controller(self, ctx: MessageContext):
+        message = ctx.message
+        if ctx.is_bot:
             return
         afk, set_at = await self.bot.db.get_member_afk(message.author.id)
         if afk is not None and (datetime.now() - set_at).seconds > 10:
@@ -3,15 +3,14 @@ from datetime import datetime
 import disnake
 from disnake.ext import commands
 
-from utils.autocomplete import invalidate as invalidate_rules
 from utils.autocomplete import rules_autocomplete
 from utils.checks import is_staff
 from utils.cog import Cog
 from utils.constants import FILEMUTED_ROLE_ID
 from utils.converters import RuleConverter, TimeConverter
 from utils.embeds import BaseEmbed, ErrorEmbed, SuccessEmbed
-from utils.enums import FetchMode
 from utils.errors import HierarchyError
+from utils.permissions import bulk_set_send_messages
 from utils.utils import datetime_to_timestamp, s_, timedelta_to_full_str
 
 RulesAutocomplete = commands.Param(autocomplete=rules_autocomplete)
@@ -208,18 +207,7 @@ class WarningsManagement(Cog):
         if user.top_role >= inter.user.top_role:
             raise HierarchyError()
 
-        await self.bot.db.add_warn(user.id, inter.user.id, rule.id)
-        total_warns = await self.bot.db.execute(
-            "SELECT COUNT(*) FROM warns WHERE target_id = $1",
-            user.id,
-            fetch_mode=FetchMode.VAL,
-        )
-        warns_for_rule = await self.bot.db.execute(
-            "SELECT COUNT(*) FROM warns WHERE target_id = $1 AND rule_violated = $2",
-            user.id,
-            rule.id,
-            fetch_mode=FetchMode.VAL,
-        )
+        total_warns, warns_for_rule = await self.bot.db.add_warn(user.id, inter.user.id, rule.id)
 
         await inter.send(
             embed=BaseEmbed(
@@ -288,10 +276,6 @@ Violated rule: `{warning.rule_violated}`",
 
 
 class ChannelsModeration(Cog):
-    def __init__(self, bot):
-        super().__init__(bot)
-        self.locked_channels: list[disnake.TextChannel] = []
-
     async def cog_slash_command_check(self, inter: disnake.ApplicationCommandInteraction) -> bool:
         return await is_staff(self.bot, inter)
 
@@ -449,35 +433,54 @@ class ChannelsModeration(Cog):
     @commands.has_permissions(manage_guild=True)
     async def lockserver(self, inter: disnake.ApplicationCommandInteraction):
         await inter.response.defer()
-        self.locked_channels = [
+        channels = [
             c
             for c in inter.guild.text_channels
             if c.permissions_for(inter.guild.default_role).send_messages is not False
         ]
-        for c in self.locked_channels:
-            overwrite = c.overwrites_for(inter.guild.default_role)
-            overwrite.send_messages = False
-            await c.set_permissions(
-                inter.guild.default_role,
-                overwrite=overwrite,
-                reason=f"Server lock done by {inter.user}",
-            )
-        await inter.send(embed=SuccessEmbed(inter.user, "Successfully locked the server"))
+        locked = await bulk_set_send_messages(
+            channels,
+            inter.guild.default_role,
+            False,
+            f"Server lock done by {inter.user}",
+            self._progress_reporter(inter, "Locking"),
+        )
+        await self.bot.db.add_server_locked_channels([c.id for c in locked])
+        await inter.edit_original_response(
+            content=None,
+            embed=SuccessEmbed(inter.user, f"Successfully locked the server ({len(locked)}/{len(channels)} channels)"),
+        )
 
     @commands.slash_command(name="unlockserver", description="Unlocks the server")
     @commands.has_permissions(manage_guild=True)
     async def unlockserver(self, inter: disnake.ApplicationCommandInteraction):
         await inter.response.defer()
-        for c in self.locked_channels:
-            overwrite = c.overwrites_for(inter.guild.default_role)
-            overwrite.send_messages = None
-            await c.set_permissions(
-                inter.guild.default_role,
-                overwrite=overwrite,
-                reason=f"Server unlock done by {inter.user}",
-            )
-        await inter.send(embed=SuccessEmbed(inter.user, "Unlocked the server"))
-        self.locked_channels.clear()
+        channel_ids = await self.bot.db.get_server_locked_channels()
+        channels = [c for c in map(inter.guild.get_channel, channel_ids) if c is not None]
+        unlocked = await bulk_set_send_messages(
+            channels,
+            inter.guild.default_role,
+            None,
+            f"Server unlock done by {inter.user}",
+            self._progress_reporter(inter, "Unlocking"),
+        )
+        # channels that failed to unlock stay stored, so the next unlockserver retries them
+        failed_ids = {c.id for c in channels} - {c.id for c in unlocked}
+        await self.bot.db.remove_server_locked_channels([i for i in channel_ids if i not in failed_ids])
+        await inter.edit_original_response(
+            content=None,
+            embed=SuccessEmbed(inter.user, f"Unlocked the server ({len(unlocked)}/{len(channels)} channels)"),
+        )
+
+    @staticmethod
+    def _progress_reporter(inter: disnake.ApplicationCommandInteraction, action: str):
+        async def report(done: int, total: int):
+            try:
+                await inter.edit_original_response(f"{action} channels... **{done}/{total}**")
+            except disnake.HTTPException:
+                pass
+
+        return report
 
 
 class RulesManagement(Cog):
@@ -493,7 +496,6 @@ class RulesManagement(Cog):
             await inter.send("Rule id cannot be longer than 5 characters", ephemeral=True)
             return
         await self.bot.db.add_rule(id, contents)
-        invalidate_rules()
         await inter.send(embed=SuccessEmbed(inter.user, f"Successfully added rule `{id}`"))
 
     @commands.slash_command(name="removerule", description="Removes a rule")
@@ -503,5 +505,4 @@ class RulesManagement(Cog):
         rule: RuleConverter = RulesAutocomplete,
     ):
         await self.bot.db.remove_rule(rule.id)
-        invalidate_rules()
         await inter.send(embed=SuccessEmbed(inter.user, f"Successfully removed rule `{rule.id}`"))
@@ -11,7 +11,7 @@ from utils.constants import (
     MEMBERS_TRACKER_ID,
     NO_PROMOCODES_NOTIFICATION_ENABLED,
 )
-from utils.enums import FetchMode
+from utils.enums import ExpirationType, FetchMode
 from utils.errors import UNKNOWN, get_error_msg
 
 
@@ -19,8 +19,9 @@ class SystemLoops(Cog):
     def __init__(self, bot: Bot):
         super().__init__(bot)
 
-        self.temproles_and_locked_channels_remover.start()
-        self.bans_remover.start()
+        self.bot.db.expirations.add_handler(ExpirationType.TEMPROLE, self.remove_temproles)
+        self.bot.db.expirations.add_handler(ExpirationType.LOCKED_CHANNEL, self.unlock_channels)
+        self.bot.db.expirations.add_handler(ExpirationType.BAN, self.remove_bans)
         self.warnings_remover.start()
         self.stats_updater.start()
         self.daily_reset.start()
@@ -38,18 +39,11 @@ class SystemLoops(Cog):
         except Exception as e:
             self.bot.log.error("Failed to update trackers", exc_info=e)
 
-    @tasks.loop(minutes=5)
-    async def temproles_and_locked_channels_remover(self):
+    async def remove_temproles(self, now: datetime):
         await self.bot.wait_until_ready()
-        now = datetime.now()
-        records = await self.bot.db.execute(
-            "SELECT * FROM temproles WHERE remove_at < $1",
-            now,
-            fetch_mode=FetchMode.ALL,
-        )
-        for r in records:
-            member = self.bot.server.get_member(r["id"])
-            role = self.bot.server.get_role(r["role_id"])
+        for member_id, role_id in await self.bot.db.pop_expired_temproles(now):
+            member = self.bot.server.get_member(member_id)
+            role = self.bot.server.get_role(role_id)
             if member is None or role is None:
                 continue
 
@@ -58,34 +52,26 @@ class SystemLoops(Cog):
             except disnake.HTTPException:
                 self.bot.log.warning("Failed to remove temprole from %s", member)
 
-        await self.bot.db.execute("DELETE FROM temproles WHERE remove_at < $1", now)
-
-        records = await self.bot.db.execute(
-            "SELECT id FROM locked_channels WHERE unlock_at < $1",
-            now,
-            fetch_mode=FetchMode.ALL,
-        )
-        for r in records:
-            channel = self.bot.server.get_channel(r["id"])
+    async def unlock_channels(self, now: datetime):
+        await self.bot.wait_until_ready()
+        for channel_id in await self.bot.db.pop_expired_locked_channels(now):
+            channel = self.bot.server.get_channel(channel_id)
             if channel is None:
-                self.bot.log.warning("Failed to unlock channel %s", r["id"])
+                self.bot.log.warning("Failed to unlock channel %s", channel_id)
                 continue
-            await channel.set_permissions(self.bot.server.default_role, send_messages=None)
 
-        await self.bot.db.execute("DELETE FROM locked_channels WHERE unlock_at < $1", now)
+            try:
+                await channel.set_permissions(self.bot.server.default_role, send_messages=None)
+            except disnake.HTTPException:
+                self.bot.log.warning("Failed to unlock channel %s", channel)
 
-    @tasks.loop(minutes=30)
-    async def bans_remover(self):
+    async def remove_bans(self, now: datetime):
         await self.bot.wait_until_ready()
-        now = datetime.now()
-        records = await self.bot.db.execute("SELECT * FROM bans WHERE unban_at < $1", now, fetch_mode=FetchMode.ALL)
-        for r in records:
+        for user_id in await self.bot.db.pop_expired_bans(now):
             try:
-                await self.bot.server.unban(disnake.Object(r["id"]))
+                await self.bot.server.unban(disnake.Object(user_id))
             except disnake.HTTPException:
-                self.bot.log.warning("Failed to unban %s", r["id"])
-
-        await self.bot.db.execute("DELETE FROM bans WHERE unban_at < $1", now)
+                self.bot.log.warning("Failed to unban %s", user_id)
 
     @tasks.loop(hours=12)
     async def warnings_remover(self):
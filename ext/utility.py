@@ -9,21 +9,11 @@ from utils.embeds import SuccessEmbed
 
 
 class ButtonRoles(Cog):
-    def __init__(self, bot):
-        super().__init__(bot)
-
-        self._button_roles: dict[str, int] = {}
-
     async def cog_slash_command_check(self, inter: disnake.ApplicationCommandInteraction) -> bool:
         if inter.user.guild_permissions.manage_guild:
             return True
         raise commands.MissingPermissions(["manage_guild"])
 
-    async def get_button_roles(self):
-        if len(self._button_roles) == 0:
-            self._button_roles = await self.bot.db.get_button_roles()
-        return self._button_roles
-
     @Cog.listener("on_raw_message_delete")
     async def clear_button_roles_data(self, payload: disnake.RawMessageDeleteEvent):
         await self.bot.db.clear_button_roles(payload.message_id)
@@ -31,7 +21,7 @@ class ButtonRoles(Cog):
     @Cog.listener("on_button_click")
     async def role_controller(self, inter: disnake.MessageInteraction):
         id = inter.component.custom_id
-        roles = await self.get_button_roles()
+        roles = await self.bot.db.get_button_roles()
         if id not in roles:
             return
 
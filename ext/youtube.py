@@ -1,19 +1,36 @@
+import asyncio
+import random
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
 import disnake
 from disnake.ext import commands, tasks
 
 from utils.checks import is_staff
 from utils.cog import Cog
-from utils.constants import APPLICATIONS_CHANNEL_ID, NEW_VIDEOS_ROLE_ID, YOUTUBE_CHANNEL_ID
+from utils.constants import (
+    APPLICATIONS_CHANNEL_ID,
+    NEW_VIDEOS_ROLE_ID,
+    YOUTUBE_ANNOUNCEMENT_INTERVAL_MINUTES,
+    YOUTUBE_ANNOUNCEMENT_TIMEOUT_SECONDS,
+    YOUTUBE_CHANNEL_ID,
+    YOUTUBE_POLL_CONCURRENCY,
+    YOUTUBE_POLL_INTERVAL_SECONDS,
+    YOUTUBE_POLL_JITTER,
+    YOUTUBE_PREMIUM_POLL_INTERVAL_SECONDS,
+)
+from utils.datamodels import Youtuber
 from utils.embeds import SuccessEmbed
 from utils.errors import YoutubeFetchFailure
-from utils.youtube import fetch_last_video
 
 
 class YoutubeFetchers(Cog):
     def __init__(self, bot):
         super().__init__(bot)
 
-        self.queue: list[tuple[int, str]] = []  # list[tuple[discord_id, youtube_id]]
+        # discord_id: video_id, mirrors the youtube_announcements table in the order videos were queued
+        self.queue: OrderedDict[int, str] = OrderedDict()
+        self.next_checks: dict[int, datetime] = {}
         self.youtube_fetcher.start()
         self.youtube_poster.start()
 
@@ -23,50 +40,112 @@ class YoutubeFetchers(Cog):
         if is_youtuber:
             self.bot.log.warning("Youtuber %s left so was removed from content creators program", member)
             await self.bot.dis_log.log_target_action("Youtuber Autoremove", member, member.guild.me)
-            for t in self.queue.copy():
-                if t[0] == member.id:
-                    self.queue.remove(t)
+            self.queue.pop(member.id, None)
 
-    @tasks.loop(minutes=5)
-    async def youtube_fetcher(self):
-        await self.bot.wait_until_ready()
-        youtubers = await self.bot.db.get_youtubers()
-        for youtuber in youtubers:
+    def _schedule_next_check(self, youtuber: Youtuber, now: datetime):
+        interval = YOUTUBE_PREMIUM_POLL_INTERVAL_SECONDS if youtuber.is_premium else YOUTUBE_POLL_INTERVAL_SECONDS
+        if youtuber.id not in self.next_checks:
+            # spread first checks evenly over the interval so they don't all hit at once
+            delay = interval * random.random()
+        else:
+            delay = interval * random.uniform(1 - YOUTUBE_POLL_JITTER, 1 + YOUTUBE_POLL_JITTER)
+        self.next_checks[youtuber.id] = now + timedelta(seconds=delay)
+
+    async def _check_youtuber(self, youtuber: Youtuber, semaphore: asyncio.Semaphore) -> str | None:
+        """Returns new last video of the youtuber or None if it didn't change"""
+        async with semaphore:
             try:
-                last_video = await fetch_last_video(youtuber.youtube_id)
+                last_video = await self.bot.youtube.fetch_last_video(youtuber.youtube_id)
             except YoutubeFetchFailure:
                 self.bot.log.error(
                     "Failed to fetch video for youtuber %s (%s)",
                     youtuber.youtube_id,
                     await self.bot.server.get_or_fetch_member(youtuber.id),
                 )
-                continue
-            if last_video != youtuber.last_video:
-                member = await self.bot.server.get_or_fetch_member(youtuber.id)
-                if member is None:
-                    await self.bot.db.remove_youtuber(youtuber.id)
-                    self.bot.log.warning(
-                        "Youtuber %s left so was removed from content creators program",
-                        youtuber.id,
-                    )
-                    continue
-                self.queue.append((youtuber.id, last_video))
-                await self.bot.db.set_youtuber_last_video(youtuber.id, last_video)
-
-    @tasks.loop(minutes=10)
-    async def youtube_poster(self):
+                return None
+        if last_video == youtuber.last_video:
+            return None
+
+        member = await self.bot.server.get_or_fetch_member(youtuber.id)
+        if member is None:
+            await self.bot.db.remove_youtuber(youtuber.id)
+            self.bot.log.warning(
+                "Youtuber %s left so was removed from content creators program",
+                youtuber.id,
+            )
+            return None
+        return last_video
+
+    @tasks.loop(seconds=30)
+    async def youtube_fetcher(self):
         await self.bot.wait_until_ready()
+        now = datetime.now()
+        due = []
+        youtubers = await self.bot.db.get_youtubers()
+        for youtuber in youtubers:
+            if youtuber.id not in self.next_checks:
+                self._schedule_next_check(youtuber, now)
+            elif self.next_checks[youtuber.id] <= now:
+                due.append(youtuber)
+                self._schedule_next_check(youtuber, now)
+        for id in self.next_checks.keys() - {y.id for y in youtubers}:
+            del self.next_checks[id]
+        if len(due) == 0:
+            return
+
+        semaphore = asyncio.Semaphore(YOUTUBE_POLL_CONCURRENCY)
+        results = await asyncio.gather(*[self._check_youtuber(y, semaphore) for y in due], return_exceptions=True)
+        last_videos = {}
+        for youtuber, result in zip(due, results):
+            if isinstance(result, Exception):
+                self.bot.log.error("Failed to check youtuber %s", youtuber.youtube_id, exc_info=result)
+            elif result is not None:
+                last_videos[youtuber.id] = result
+        if len(last_videos) > 0:
+            await self.bot.db.queue_youtube_announcements(last_videos)
+            self.queue.update(last_videos)
+
+    @tasks.loop(minutes=YOUTUBE_ANNOUNCEMENT_INTERVAL_MINUTES)
+    async def youtube_poster(self):
         if len(self.queue) == 0:
             return
 
-        id, last_video = self.queue.pop(0)
+        id, last_video = next(iter(self.queue.items()))
         youtube_channel = self.bot.server.get_channel(YOUTUBE_CHANNEL_ID)
-        m = await youtube_channel.send(
-            f"<@&{NEW_VIDEOS_ROLE_ID}>\nOur content creator <@{id}> "
-            f"just posted a new video!\n\nhttps://youtube.com/watch?v={last_video}\n\n"
-            f"Want to be advertised like this as well? Check out <#{APPLICATIONS_CHANNEL_ID}>"
-        )
-        await m.publish()
+        if youtube_channel is None:
+            self.bot.log.error("Youtube channel %s was not found, announcements are left queued", YOUTUBE_CHANNEL_ID)
+            return
+        message = None
+
+        async def post():
+            nonlocal message
+            # runs in the transaction holding the youtuber row lock, so the send is capped
+            message = await asyncio.wait_for(
+                youtube_channel.send(
+                    f"<@&{NEW_VIDEOS_ROLE_ID}>\nOur content creator <@{id}> "
+                    f"just posted a new video!\n\nhttps://youtube.com/watch?v={last_video}\n\n"
+                    f"Want to be advertised like this as well? Check out <#{APPLICATIONS_CHANNEL_ID}>"
+                ),
+                YOUTUBE_ANNOUNCEMENT_TIMEOUT_SECONDS,
+            )
+
+        try:
+            await self.bot.db.announce_youtube_video(id, last_video, post)
+        except (disnake.HTTPException, asyncio.TimeoutError) as e:
+            self.bot.log.error("Failed to announce video %s of youtuber %s, retrying later", last_video, id, exc_info=e)
+            return
+        if self.queue.get(id) == last_video:
+            del self.queue[id]
+        if message is not None:
+            try:
+                await message.publish()
+            except disnake.HTTPException as e:
+                self.bot.log.error("Failed to publish announcement of video %s", last_video, exc_info=e)
+
+    @youtube_poster.before_loop
+    async def load_announcements(self):
+        await self.bot.wait_until_ready()
+        self.queue = OrderedDict(await self.bot.db.get_youtube_announcements())
 
 
 class YoutubeManagement(Cog):
@@ -81,7 +160,8 @@ class YoutubeManagement(Cog):
         youtube_id: str,
         premium: bool,
     ):
-        await self.bot.db.add_youtuber(user.id, youtube_id, premium)
+        last_video = await self.bot.youtube.fetch_last_video(youtube_id)
+        await self.bot.db.add_youtuber(user.id, youtube_id, last_video, premium)
         await inter.send(
             embed=SuccessEmbed(
                 inter.user,
@@ -0,0 +1,44 @@
+import asyncio
+import os
+from dataclasses import dataclass
+
+import asyncpg
+import pytest
+
+from utils.enums import FetchMode
+from utils.statements import Statement, fetch_statement
+
+pytestmark = pytest.mark.skipif(os.getenv("DATABASE") is None, reason="needs a Postgres database")
+
+
+@dataclass(slots=True)
+class Pair:
+    a: int
+    b: str
+
+
+GET_PAIR = Statement("get_pair", "SELECT $1::INT AS a, $2::TEXT AS b", Pair)
+
+
+async def _fetch_twice() -> list[Pair]:
+    pool = await asyncpg.create_pool(
+        database=os.getenv("DATABASE"),
+        host=os.getenv("HOST"),
+        user=os.getenv("USER"),
+        password=os.getenv("PASSWORD"),
+        min_size=1,
+        max_size=1,
+    )
+    pairs = []
+    try:
+        # the pool has one connection, so both checkouts get the same one
+        for i in range(2):
+            async with pool.acquire() as con:
+                pairs.append(await fetch_statement(con, GET_PAIR, (i, str(i)), FetchMode.ROW))
+    finally:
+        await pool.close()
+    return pairs
+
+
+def test_statement_runs_on_each_checkout_of_a_connection():
+    assert asyncio.run(_fetch_twice()) == [Pair(0, "0"), Pair(1, "1")]
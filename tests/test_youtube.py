@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+import utils.youtube
+from utils.errors import YoutubeFetchFailure
+from utils.youtube import YoutubeClient
+
+FEED = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+    <yt:channelId>UCchannel</yt:channelId>
+    <title>Channel</title>
+    <entry>
+        <id>yt:video:newest</id>
+        <yt:videoId>newest</yt:videoId>
+    </entry>
+    <entry>
+        <id>yt:video:older</id>
+        <yt:videoId>older</yt:videoId>
+    </entry>
+</feed>
+"""
+
+
+async def _feed(request: web.Request) -> web.Response:
+    match request.query["channel_id"]:
+        case "UCchannel":
+            return web.Response(body=FEED, content_type="application/atom+xml")
+        case "UCbroken":
+            return web.Response(body=FEED[:200], content_type="application/atom+xml")
+        case _:
+            return web.Response(status=404)
+
+
+async def _activities(request: web.Request) -> web.Response:
+    if request.query["key"] != "key":
+        return web.Response(status=403)
+    return web.json_response({"items": [{"contentDetails": {"upload": {"videoId": "from_api"}}}]})
+
+
+async def _run_with_server(monkeypatch, youtube_id: str, fallback: bool = False) -> str:
+    app = web.Application()
+    app.router.add_get("/feeds/videos.xml", _feed)
+    app.router.add_get("/youtube/v3/activities", _activities)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    monkeypatch.setattr(utils.youtube, "FEED_URL", f"http://127.0.0.1:{port}/feeds/videos.xml")
+    monkeypatch.setattr(utils.youtube, "ACTIVITIES_URL", f"http://127.0.0.1:{port}/youtube/v3/activities")
+    monkeypatch.setattr(utils.youtube, "GOOGLE_API_KEY", "key")
+
+    client = YoutubeClient(backend="feed")
+    try:
+        if fallback:
+            return await client.fetch_last_video(youtube_id)
+        return await client.fetch_last_video_from_feed(youtube_id)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def test_feed_returns_newest_video(monkeypatch):
+    assert asyncio.run(_run_with_server(monkeypatch, "UCchannel")) == "newest"
+
+
+@pytest.mark.parametrize("youtube_id", ["UCmissing", "UCbroken"])
+def test_feed_failures_raise_fetch_failure(monkeypatch, youtube_id):
+    with pytest.raises(YoutubeFetchFailure):
+        asyncio.run(_run_with_server(monkeypatch, youtube_id))
+
+
+@pytest.mark.parametrize("youtube_id", ["UCmissing", "UCbroken"])
+def test_feed_failures_fall_back_to_api(monkeypatch, youtube_id):
+    assert asyncio.run(_run_with_server(monkeypatch, youtube_id, fallback=True)) == "from_api"
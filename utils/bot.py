@@ -1,21 +1,76 @@
+import asyncio
 import importlib.util
 import inspect
 import os
 import sys
+import time
 import traceback
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Awaitable, Callable
 
 import disnake
+from aiohttp import web
 from disnake.ext import commands
 from exencolorlogs import Logger
 
-from utils.constants import GUILD_ID, LOG_CHANNEL_ID, STAFF_ROLE_ID
+from utils.constants import (
+    GUILD_ID,
+    LOG_CHANNEL_ID,
+    LOOP_LAG_SAMPLE_INTERVAL_SECONDS,
+    LOOP_STALL_THRESHOLD_SECONDS,
+    PROFILER_WINDOW,
+    STAFF_ROLE_ID,
+)
 from utils.datamodels import Database
+from utils.image_generator import renderer
+from utils.metrics import start_metrics_server
+from utils.profiler import HandlerProfiler, LoopMonitor
 from utils.utils import timedelta_to_full_str, timedelta_to_timestamp
 from utils.views import ApplicationControlsView, ApplicationsView, PromocodeView
+from utils.youtube import YoutubeClient
 
 REQUIRED_DIRS = ["logs", "backgrounds"]
 PERSISTENT_VIEWS = [ApplicationsView, ApplicationControlsView]
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+
+@dataclass
+class MessageContext:
+    """Facts about a message computed once and shared by all message stages"""
+
+    message: disnake.Message
+    member: disnake.Member | None
+    is_bot: bool
+    is_admin: bool
+    channel_id: int
+    category_id: int | None
+
+    @classmethod
+    def from_message(cls, message: disnake.Message) -> "MessageContext":
+        member = message.author if isinstance(message.author, disnake.Member) else None
+        return cls(
+            message,
+            member,
+            message.author.bot,
+            member is not None and member.guild_permissions.manage_guild,
+            message.channel.id,
+            getattr(message.channel, "category_id", None),
+        )
+
+
+MessageStage = Callable[[MessageContext], Awaitable[bool | None]]
+
+
+def message_stage(order: int):
+    """Registers cog method as a message stage. Stages run in ascending order and
+    returning True from a stage means the message was consumed, so the following stages are skipped"""
+
+    def decorator(func):
+        func.__message_stage_order__ = order
+        return func
+
+    return decorator
 
 
 class Bot(commands.Bot):
@@ -35,6 +90,14 @@ class Bot(commands.Bot):
         self.log = Logger()
         self.db = Database()
         self.dis_log = DisLogger(self)
+        self.youtube = YoutubeClient()
+        self.message_stages: list[tuple[int, MessageStage]] = []
+        self._metrics_server: web.AppRunner | None = None
+        self.profiler = HandlerProfiler(PROFILER_WINDOW)
+        self.loop_monitor = LoopMonitor(LOOP_LAG_SAMPLE_INTERVAL_SECONDS, LOOP_STALL_THRESHOLD_SECONDS, PROFILER_WINDOW)
+        self._slash_command_starts: dict[int, float] = {}
+        self.before_slash_command_invoke(self._slash_command_started)
+        self.after_slash_command_invoke(self._slash_command_finished)
 
     def check_required_dirs(self):
         self.log.info("Checking required directories...")
@@ -55,17 +118,44 @@ class Bot(commands.Bot):
 
     async def start(self, *args, **kwargs):
         self.log.info("Starting...")
+        self.loop_monitor.start()
         self.setup_persistent_views()
+        renderer.start()
         await self.db.connect()
+        if METRICS_PORT is not None:
+            self._metrics_server = await start_metrics_server(self.render_metrics, int(METRICS_PORT))
+            self.log.info("Serving metrics on port %s", METRICS_PORT)
 
         await super().start(*args, **kwargs)
 
     async def close(self):
         self.log.info("Shutting down...")
+        if self._metrics_server is not None:
+            await self._metrics_server.cleanup()
         await self.db.close()
+        renderer.close()
+        await self.youtube.close()
+
+        self.loop_monitor.stop()
 
         await super().close()
 
+    def render_metrics(self) -> list[str]:
+        return (
+            self.db.metrics.render(self.db.pool)
+            + self.db.cache.render()
+            + self.loop_monitor.render()
+            + self.profiler.render()
+        )
+
+    async def _slash_command_started(self, inter: disnake.ApplicationCommandInteraction):
+        self._slash_command_starts[inter.id] = time.perf_counter()
+
+    async def _slash_command_finished(self, inter: disnake.ApplicationCommandInteraction):
+        start = self._slash_command_starts.pop(inter.id, None)
+        if start is not None:
+            self.profiler.record(f"/{inter.application_command.qualified_name}", time.perf_counter() - start)
+
     async def on_ready(self):
         self.log.info("Bot is ready!")
 
@@ -74,6 +164,17 @@ class Bot(commands.Bot):
         self.staff_role = self.server.get_role(STAFF_ROLE_ID)
         self.dis_log.load()
 
+    async def on_message(self, message: disnake.Message):
+        ctx = MessageContext.from_message(message)
+        for _, stage in self.message_stages:
+            try:
+                if await stage(ctx):
+                    break
+            except Exception:
+                await self.on_error(stage.__qualname__)
+
+        await self.process_commands(message)
+
     def auto_setup(self, module_name: str):
         module = importlib.import_module(module_name, None)
         sys.modules[module_name] = module
@@ -82,7 +183,10 @@ class Bot(commands.Bot):
             lambda x: inspect.isclass(x) and issubclass(x, commands.Cog) and x.__name__ != "Cog",
         )
         for member in members:
-            self.add_cog(member[1](self))
+            cog = member[1](self)
+            self.profile_listeners(cog)
+            self.add_cog(cog)
+            self.add_message_stages(cog)
 
         self.log.ok("%s loaded", module_name)
 
@@ -96,6 +200,18 @@ class Bot(commands.Bot):
             elif full_path.endswith(".py"):
                 self.auto_setup(full_path[:-3].replace("/", "."))
 
+    def profile_listeners(self, cog: commands.Cog):
+        """Replaces listeners of the cog with timed wrappers, must be called before the cog is added"""
+        for method_name in {method_name for _, method_name in cog.__cog_listeners__}:
+            name = f"{type(cog).__name__}.{method_name}"
+            setattr(cog, method_name, self.profiler.wrap(name, getattr(cog, method_name)))
+
+    def add_message_stages(self, cog: commands.Cog):
+        for name, func in inspect.getmembers(type(cog), lambda x: hasattr(x, "__message_stage_order__")):
+            stage = self.profiler.wrap(func.__qualname__, getattr(cog, name))
+            self.message_stages.append((func.__message_stage_order__, stage))
+        self.message_stages.sort(key=lambda x: x[0])
+
     def setup_persistent_views(self):
         for cls in PERSISTENT_VIEWS:
             self.add_view(cls())
@@ -112,11 +228,8 @@ class Bot(commands.Bot):
             os.mkdir(month_path)
 
         path = f"{month_path}/{now.day}.log.err"
-        with open(path, "a") as f:
-            f.write("\n" + "-" * 50)
-            f.write(f"\n{datetime.now()}\n")
-            tb = traceback.format_exc()
-            f.write(tb)
+        tb = traceback.format_exc()
+        await asyncio.to_thread(_append_error, path, tb)
 
         await self.dis_log.log_channel.send(
             self.owner.mention,
@@ -128,6 +241,13 @@ class Bot(commands.Bot):
         )
 
 
+def _append_error(path: str, tb: str):
+    with open(path, "a") as f:
+        f.write("\n" + "-" * 50)
+        f.write(f"\n{datetime.now()}\n")
+        f.write(tb)
+
+
 class DisLogger:
     log_channel: disnake.TextChannel
 
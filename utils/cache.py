@@ -0,0 +1,107 @@
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+MISSING = object()
+
+
+class TTLCache:
+    """Size-bounded LRU cache with per-key time to live.
+
+    Entries can be tagged, invalidating a tag drops every entry carrying it. `generation` is bumped on every
+    invalidation, so a value loaded while an invalidation happened can be recognized as stale and not stored.
+    """
+
+    def __init__(self, max_size: int, default_ttl: float | None = None):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()  # key: (value, expires_at)
+        self._key_tags: dict[Hashable, tuple[str, ...]] = {}
+        self._tag_keys: dict[str, set[Hashable]] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            self._discard(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None, tags: Iterable[str] = ()):
+        self._discard(key)
+        ttl = ttl if ttl is not None else self.default_ttl
+        self._entries[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self._key_tags[key] = tuple(tags)
+        for tag in self._key_tags[key]:
+            self._tag_keys.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._discard(next(iter(self._entries)))
+
+    def invalidate(self, *tags: str):
+        self.generation += 1
+        for tag in tags:
+            for key in self._tag_keys.pop(tag, set()):
+                self._discard(key)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._key_tags.clear()
+        self._tag_keys.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+    def render(self) -> list[str]:
+        return [
+            "# TYPE db_cache_hits_total counter",
+            f"db_cache_hits_total {self.hits}",
+            "# TYPE db_cache_misses_total counter",
+            f"db_cache_misses_total {self.misses}",
+            "# TYPE db_cache_size gauge",
+            f"db_cache_size {len(self)}",
+        ]
+
+    def _discard(self, key: Hashable):
+        if self._entries.pop(key, None) is None:
+            return
+        for tag in self._key_tags.pop(key):
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self._tag_keys[tag]
+
+
+def cached(*tags: str, ttl: float | None = None):
+    """Caches results of an async method in the `cache` attribute of its object, keyed by method name and arguments.
+
+    Write methods are expected to invalidate the tags of read methods they affect.
+    """
+
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        @wraps(func)
+        async def wrapper(self, *args):
+            key = (func.__name__, *args)
+            value = self.cache.get(key, MISSING)
+            if value is MISSING:
+                generation = self.cache.generation
+                value = await func(self, *args)
+                if self.cache.generation == generation:
+                    self.cache.set(key, value, ttl=ttl, tags=tags)
+            return value
+
+        return wrapper
+
+    return decorator
@@ -29,6 +29,19 @@ JOB_APPLICATIONS_CATEGORY_ID = 906613674821689404
 # other
 XP_BOUNDS = (15, 25)
 XP_COOLDOWN_SECONDS = 60
+XP_FLUSH_INTERVAL_SECONDS = 15
+XP_FLUSH_THRESHOLD = 50
+DB_CACHE_SIZE = 256
+DB_CACHE_TTL_SECONDS = 600
+RENDER_WORKERS = 2
+RENDER_QUEUE_SIZE = 8
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_CACHE_BYTES = 8 * 1024 * 1024
+BULK_EDIT_CONCURRENCY = 10
+BULK_EDIT_PROGRESS_INTERVAL_SECONDS = 2
+LOOP_LAG_SAMPLE_INTERVAL_SECONDS = 0.5
+LOOP_STALL_THRESHOLD_SECONDS = 1
+PROFILER_WINDOW = 1000
 
 # promocodes
 PROMOCODE_REQUIRED_SCORE = 1000
@@ -36,6 +49,14 @@ PROMOCODE_NOTIFICATIONS = [250, 500, 750, PROMOCODE_REQUIRED_SCORE]
 PROMOCODE_CHANNEL_ID = 1076786001172779008
 NO_PROMOCODES_NOTIFICATION_ENABLED = False
 
+# youtube
+YOUTUBE_POLL_INTERVAL_SECONDS = 300
+YOUTUBE_PREMIUM_POLL_INTERVAL_SECONDS = 120
+YOUTUBE_POLL_JITTER = 0.1
+YOUTUBE_POLL_CONCURRENCY = 5
+YOUTUBE_ANNOUNCEMENT_INTERVAL_MINUTES = 10
+YOUTUBE_ANNOUNCEMENT_TIMEOUT_SECONDS = 10
+
 # applications links
 APPLICATIONS_LINKS = {
     "appl_server_staff": "https://forms.gle/MvCCMrXm9gjVKAvr6",
@@ -1,23 +1,39 @@
+import asyncio
 import os
-from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Any, overload
+import re
+import sys
+import time
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, overload
 
 import asyncpg
 import disnake
 from exencolorlogs import Logger
 
+from utils.cache import TTLCache, cached
+from utils.constants import DB_CACHE_SIZE, DB_CACHE_TTL_SECONDS, LEADERBOARD_PAGE_SIZE, XP_FLUSH_THRESHOLD
 from utils.db_updater import update_db
-from utils.enums import FetchMode
-from utils.youtube import fetch_last_video
+from utils.enums import ExpirationType, FetchMode
+from utils.metrics import DatabaseMetrics
+from utils.rank_index import RankIndex
+from utils.scheduler import ExpirationScheduler
+from utils.score_buffer import ScoreBuffer
+from utils.statements import Statement, fetch_statement
 
 DATABASE = os.getenv("DATABASE")
 HOST = os.getenv("HOST")
 USER = os.getenv("USER")
 PASSWORD = os.getenv("PASSWORD")
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", str(min(10, POOL_MAX_SIZE))))
+TABLE_CHANGES_CHANNEL = "table_changes"
+LISTENER_RECONNECT_DELAY = 5
 
 
-@dataclass
+@dataclass(slots=True)
 class Warn:
     id: int
     target_id: int
@@ -26,11 +42,68 @@ class Warn:
     rule_violated: str
 
 
-@dataclass
+@dataclass(slots=True)
+class Score:
+    total: int = 0
+    daily: int = 0
+    weekly: int = 0
+    left_server: bool = False
+    promo_notifications: set[int] = field(default_factory=set)
+
+
+@dataclass(slots=True)
 class Youtuber:
     id: int
     youtube_id: str
     last_video: str
+    is_premium: bool
+
+
+class LevelRoles:
+    """Level roles ordered by required score, with roles a member should have at each level precomputed.
+    Level is the amount of thresholds the score is above"""
+
+    def __init__(self, levels: dict[int, int]):
+        self.thresholds = sorted(levels)
+        self.roles = [levels[t] for t in self.thresholds]
+        self.all_roles = frozenset(self.roles)
+        self.targets = [frozenset(self.roles[:i]) for i in range(len(self.roles) + 1)]
+
+    def __eq__(self, other):
+        if not isinstance(other, LevelRoles):
+            return NotImplemented
+        return self.thresholds == other.thresholds and self.roles == other.roles
+
+    def level(self, score: int) -> int:
+        return bisect_left(self.thresholds, score)
+
+
+ADD_WARN = Statement(
+    "add_warn",
+    # the outer query doesn't see the row inserted by the CTE, so it is counted separately
+    "WITH inserted AS (INSERT INTO warns (target_id, issuer_id, rule_violated) VALUES ($1, $2, $3)) "
+    "SELECT COUNT(*) + 1 AS total, COUNT(*) FILTER (WHERE rule_violated = $3) + 1 AS for_rule "
+    "FROM warns WHERE target_id = $1",
+)
+GET_WARNS = Statement(
+    "get_warns",
+    "SELECT id, target_id, issuer_id, issued_at, rule_violated FROM warns WHERE target_id = $1",
+    Warn,
+)
+ADD_SCORE = Statement(
+    "add_score",
+    "INSERT INTO scores (id, score_total) VALUES ($1, $2) "
+    "ON CONFLICT (id) DO UPDATE SET score_total = scores.score_total + $2, left_server = false",
+)
+ADD_SCORE_DELTAS = Statement(
+    "add_score_deltas",
+    "INSERT INTO scores (id, score_total, score_daily, score_weekly) "
+    "SELECT id, delta, delta, delta FROM UNNEST($1::BIGINT[], $2::INT[]) AS d (id, delta) "
+    "ON CONFLICT (id) DO UPDATE SET score_total = scores.score_total + EXCLUDED.score_total, "
+    "score_daily = scores.score_daily + EXCLUDED.score_daily, "
+    "score_weekly = scores.score_weekly + EXCLUDED.score_weekly, left_server = false",
+)
+GET_YOUTUBERS = Statement("get_youtubers", "SELECT id, youtube_id, last_video, is_premium FROM youtubers", Youtuber)
 
 
 class Database:
@@ -51,20 +124,70 @@ class Database:
 
         self._connection_config.update(connection_config)
         self._cache = Cache()
-        self._promocodes_present: bool | None = None
+        self.cache = TTLCache(DB_CACHE_SIZE, DB_CACHE_TTL_SECONDS)
+        self._score_buffer = ScoreBuffer(XP_FLUSH_THRESHOLD)
+        self._ranks = RankIndex(LEADERBOARD_PAGE_SIZE)
+        self.expirations = ExpirationScheduler()
+        self.metrics = DatabaseMetrics()
+        self._listener: asyncpg.Connection | None = None
+        self._listener_reconnect: asyncio.Task | None = None
 
     async def connect(self):
         self.log.info("Creating connection pool...")
-        self._pool = await asyncpg.create_pool(**self._connection_config)
+        self._pool = await asyncpg.create_pool(
+            **self._connection_config,
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+        )
         self.log.ok("Connection pool created successfully!")
         await self.setup("base_config.sql")
         await update_db(self)
+        await self._connect_listener()
+        await self.load_scores()
+        await self.load_afks()
+        await self.load_expirations()
+        self.expirations.start()
 
     async def close(self):
+        self.expirations.stop()
+        await self.flush_scores()
+        if self._listener_reconnect is not None:
+            self._listener_reconnect.cancel()
+        if self._listener is not None:
+            self._listener.remove_termination_listener(self._on_listener_terminated)
+            await self._listener.close()
         self.log.info("Closing connection pool...")
         await self._pool.close()
         self.log.ok("Connection pool closed successfully")
 
+    async def _connect_listener(self):
+        """Opens a dedicated connection receiving table change notifications, which invalidate cached reads"""
+        self._listener = await asyncpg.connect(**self._connection_config)
+        self._listener.add_termination_listener(self._on_listener_terminated)
+        await self._listener.add_listener(TABLE_CHANGES_CHANNEL, self._on_table_change)
+
+    def _on_table_change(self, con: asyncpg.Connection, pid: int, channel: str, table: str):
+        self.cache.invalidate(table)
+
+    def _on_listener_terminated(self, con: asyncpg.Connection):
+        self.log.warning("Table change listener disconnected, reconnecting...")
+        self._listener = None
+        self.cache.clear()
+        self._listener_reconnect = asyncio.create_task(self._reconnect_listener())
+
+    async def _reconnect_listener(self):
+        while True:
+            try:
+                await self._connect_listener()
+            except (OSError, asyncpg.PostgresError):
+                await asyncio.sleep(LISTENER_RECONNECT_DELAY)
+                continue
+            # changes made while disconnected were missed
+            self.cache.clear()
+            self._listener_reconnect = None
+            self.log.ok("Table change listener reconnected")
+            return
+
     @property
     def pool(self):
         return self._pool
@@ -72,61 +195,103 @@ class Database:
     async def execute(
         self, query: str, *args, fetch_mode: FetchMode = FetchMode.NONE
     ) -> None | list[dict] | dict | Any:
-        if query.upper().startswith("SELECT") and fetch_mode == FetchMode.NONE:
-            self.log.warning("Selection with no output. Query: %s", query)
+        name = _caller_name()
+        async with self._acquire() as con:
+            with self.metrics.time_query(name):
+                return await _fetch(self.log, con, query, args, fetch_mode)
+
+    async def execute_statement(
+        self, statement: Statement, *args, fetch_mode: FetchMode = FetchMode.NONE
+    ) -> None | list | Any:
+        async with self._acquire() as con:
+            with self.metrics.time_query(statement.name):
+                return await fetch_statement(con, statement, args, fetch_mode)
+
+    @asynccontextmanager
+    async def _acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        start = time.perf_counter()
         async with self._pool.acquire() as con:
+            self.metrics.acquire.observe(time.perf_counter() - start)
+            yield con
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator["Transaction"]:
+        """Holds one pooled connection for the block and runs all statements of it in a single transaction"""
+        async with self._acquire() as con:
             con: asyncpg.Connection
-            match fetch_mode:  # noqa: E999
-                case FetchMode.NONE:
-                    return await con.execute(query, *args)
-                case FetchMode.VAL:
-                    return await con.fetchval(query, *args)
-                case FetchMode.ROW:
-                    return await con.fetchrow(query, *args)
-                case FetchMode.ALL:
-                    return await con.fetch(query, *args)
+            async with con.transaction():
+                yield Transaction(self.log, self.metrics, con)
 
     async def setup(self, filename: str = "base_config.sql"):
         self.log.info("Executing setup statements...")
         with open(filename, "r") as f:
-            async with self._pool.acquire() as con:
+            async with self._acquire() as con:
                 con: asyncpg.Connection
                 for sql in f.read().split(";\n"):
                     if len(sql) <= 1:
                         continue
                     await con.execute(sql)
 
+    async def load_afks(self):
+        self._cache.afks = {
+            r["id"]: (r["afk"], r["set_at"])
+            for r in await self.execute("SELECT id, afk, set_at FROM afks", fetch_mode=FetchMode.ALL)
+        }
+
     async def get_member_afk(self, id: int) -> tuple[str, datetime] | tuple[None, None]:
-        r = await self.execute("SELECT afk, set_at FROM afks WHERE id = $1", id, fetch_mode=FetchMode.ROW)
-        if r is None:
-            return None, None
-        return r["afk"], r["set_at"]
+        return self._cache.afks.get(id, (None, None))
 
     async def reset_member_afk(self, id: int):
-        await self.execute("DELETE FROM afks WHERE id = $1", id)
+        if self._cache.afks.pop(id, None) is not None:
+            await self.execute("DELETE FROM afks WHERE id = $1", id)
 
     async def set_member_afk(self, id: int, afk: str):
-        await self.execute(
-            "INSERT INTO afks (id, afk) VALUES ($1, $2) ON CONFLICT (id) DO UPDATE SET afk = $2",
+        set_at = await self.execute(
+            "INSERT INTO afks (id, afk) VALUES ($1, $2) ON CONFLICT (id) DO UPDATE SET afk = $2 RETURNING set_at",
             id,
             afk,
+            fetch_mode=FetchMode.VAL,
         )
+        self._cache.afks[id] = (afk, set_at)
+
+    async def load_expirations(self):
+        for query, type in (
+            ("SELECT remove_at FROM temproles", ExpirationType.TEMPROLE),
+            ("SELECT unban_at FROM bans WHERE unban_at IS NOT NULL", ExpirationType.BAN),
+            ("SELECT unlock_at FROM locked_channels WHERE unlock_at IS NOT NULL", ExpirationType.LOCKED_CHANNEL),
+        ):
+            for r in await self.execute(query, fetch_mode=FetchMode.ALL):
+                self.expirations.schedule(r[0], type)
 
     async def add_temprole(self, user_id: int, role_id: int, duration: timedelta):
+        remove_at = datetime.now() + duration
         await self.execute(
             "INSERT INTO temproles (id, role_id, remove_at) VALUES ($1, $2, $3)",
             user_id,
             role_id,
-            datetime.now() + duration,
+            remove_at,
         )
+        self.expirations.schedule(remove_at, ExpirationType.TEMPROLE)
 
-    async def add_warn(self, target_id: int, issuer_id: int, rule_violated: str):
-        await self.execute(
-            "INSERT INTO warns (target_id, issuer_id, rule_violated) VALUES ($1, $2, $3)",
+    async def pop_expired_temproles(self, now: datetime) -> list[tuple[int, int]]:
+        """Deletes expired temproles and returns list of `(member_id, role_id)` tuples"""
+        return [
+            (r["id"], r["role_id"])
+            for r in await self.execute(
+                "DELETE FROM temproles WHERE remove_at <= $1 RETURNING id, role_id", now, fetch_mode=FetchMode.ALL
+            )
+        ]
+
+    async def add_warn(self, target_id: int, issuer_id: int, rule_violated: str) -> tuple[int, int]:
+        """Returns amounts of warnings the target has in total and for the violated rule, including the new one"""
+        r = await self.execute_statement(
+            ADD_WARN,
             target_id,
             issuer_id,
             rule_violated,
+            fetch_mode=FetchMode.ROW,
         )
+        return r["total"], r["for_rule"]
 
     async def delete_warn(self, id: int) -> bool:
         """Returns True if warning existed, False if it didn't"""
@@ -145,88 +310,193 @@ class Database:
         )
 
     async def get_warns(self, user_id: int) -> list[Warn]:
-        return [
-            Warn(*r.values())
-            for r in await self.execute(
-                "SELECT id, target_id, issuer_id, issued_at, rule_violated \
-FROM warns WHERE target_id = $1",
-                user_id,
-                fetch_mode=FetchMode.ALL,
-            )
-        ]
+        return await self.execute_statement(GET_WARNS, user_id, fetch_mode=FetchMode.ALL)
 
     async def add_locked_channel(self, channel_id: int, duration: timedelta):
+        unlock_at = datetime.now() + duration
         await self.execute(
             "INSERT INTO locked_channels (id, unlock_at) VALUES ($1, $2)",
             channel_id,
-            datetime.now() + duration,
+            unlock_at,
         )
+        self.expirations.schedule(unlock_at, ExpirationType.LOCKED_CHANNEL)
+
+    async def pop_expired_locked_channels(self, now: datetime) -> list[int]:
+        return [
+            r["id"]
+            for r in await self.execute(
+                "DELETE FROM locked_channels WHERE unlock_at <= $1 RETURNING id", now, fetch_mode=FetchMode.ALL
+            )
+        ]
 
     async def remove_locked_channel(self, channel_id: int):
         await self.execute("DELETE FROM locked_channels WHERE id = $1", channel_id)
 
+    async def add_server_locked_channels(self, channel_ids: list[int]):
+        async with self._acquire() as con, self.metrics.time_query("add_server_locked_channels"):
+            con: asyncpg.Connection
+            await con.executemany(
+                "INSERT INTO server_locked_channels (id) VALUES ($1) ON CONFLICT DO NOTHING",
+                [(i,) for i in channel_ids],
+            )
+
+    async def get_server_locked_channels(self) -> list[int]:
+        return [r["id"] for r in await self.execute("SELECT id FROM server_locked_channels", fetch_mode=FetchMode.ALL)]
+
+    async def remove_server_locked_channels(self, channel_ids: list[int]):
+        await self.execute("DELETE FROM server_locked_channels WHERE id = ANY($1::BIGINT[])", channel_ids)
+
+    @cached("levels")
     async def get_level_roles(self) -> dict[int, int]:
         """Returns a dict where keys are required scores and values are role ids"""
-        if len(self._cache.level_roles) == 0:
-            self._cache.level_roles = {
-                r["required_score"]: r["role_id"]
-                for r in await self.execute(
-                    "SELECT required_score, role_id FROM levels ORDER BY required_score",
-                    fetch_mode=FetchMode.ALL,
-                )
-            }
-        return self._cache.level_roles
+        return {
+            r["required_score"]: r["role_id"]
+            for r in await self.execute(
+                "SELECT required_score, role_id FROM levels ORDER BY required_score",
+                fetch_mode=FetchMode.ALL,
+            )
+        }
 
-    async def get_users_score(self, user_id: int) -> int:
-        return (
-            await self.execute(
-                "SELECT score_total FROM scores WHERE id = $1",
-                user_id,
-                fetch_mode=FetchMode.VAL,
+    @cached("levels")
+    async def get_level_table(self) -> LevelRoles:
+        return LevelRoles(await self.get_level_roles())
+
+    async def load_scores(self):
+        self.log.info("Loading scores...")
+        self._cache.scores = {
+            r["id"]: Score(r["score_total"], r["score_daily"], r["score_weekly"], r["left_server"])
+            for r in await self.execute(
+                "SELECT id, score_total, score_daily, score_weekly, left_server FROM scores",
+                fetch_mode=FetchMode.ALL,
             )
-            or 0
+        }
+        for r in await self.execute("SELECT id, score FROM promo_notifications", fetch_mode=FetchMode.ALL):
+            self._get_score(r["id"]).promo_notifications.add(r["score"])
+        self._ranks.load({i: s.total for i, s in self._cache.scores.items() if not s.left_server})
+        self.log.ok("Loaded scores of %s members", len(self._cache.scores))
+
+    def _get_score(self, user_id: int) -> "Score":
+        if user_id not in self._cache.scores:
+            self._cache.scores[user_id] = Score()
+        return self._cache.scores[user_id]
+
+    async def get_score(self, user_id: int) -> "Score":
+        return self._cache.scores.get(user_id) or Score()
+
+    async def get_users_score(self, user_id: int) -> int:
+        return (await self.get_score(user_id)).total
+
+    async def get_users_weekly_score(self, user_id: int) -> int:
+        return (await self.get_score(user_id)).weekly
+
+    async def get_promo_notifications(self, user_id: int) -> set[int]:
+        return (await self.get_score(user_id)).promo_notifications
+
+    async def add_promo_notifications(self, user_id: int, scores: set[int]):
+        await self.execute(
+            "INSERT INTO promo_notifications (id, score) SELECT $1, UNNEST($2::INT[]) ON CONFLICT DO NOTHING",
+            user_id,
+            list(scores),
         )
+        self._get_score(user_id).promo_notifications.update(scores)
 
     # noinspection SqlWithoutWhere
     async def reset_daily_score(self):
-        await self.execute("DELETE FROM promocodes WHERE expires_at < CURRENT_DATE")
-        self.invalidate_promocodes()
-        if datetime.now().weekday() == 0:
-            await self.execute("UPDATE scores SET score_daily = 0, score_weekly = 0")
-            await self.execute("TRUNCATE promo_notifications")
-            return
-        await self.execute("UPDATE scores SET score_daily = 0")
+        is_new_week = datetime.now().weekday() == 0
+        # drained deltas and the counters they belong to are reset together, before anything is awaited, so score
+        # granted while the transaction runs is counted for the next day in both the buffer and the mirror
+        deltas = self._score_buffer.drain()
+        counters = [(score, score.daily, score.weekly) for score in self._cache.scores.values()]
+        for score in self._cache.scores.values():
+            score.daily = 0
+            if is_new_week:
+                score.weekly = 0
+        try:
+            async with self.transaction() as tx:
+                await self._write_score_deltas(tx, deltas)
+                await tx.execute("DELETE FROM promocodes WHERE expires_at < CURRENT_DATE")
+                if is_new_week:
+                    await tx.execute("UPDATE scores SET score_daily = 0, score_weekly = 0")
+                    await tx.execute("TRUNCATE promo_notifications")
+                else:
+                    await tx.execute("UPDATE scores SET score_daily = 0")
+        except Exception:
+            self._score_buffer.restore(deltas)
+            for score, daily, weekly in counters:
+                score.daily += daily
+                if is_new_week:
+                    score.weekly += weekly
+            raise
+
+        self.cache.invalidate("promocodes")
+        if is_new_week:
+            for score in self._cache.scores.values():
+                score.promo_notifications.clear()
 
     async def get_total_daily_score(self) -> int:
+        await self.flush_scores()
         return await self.execute("SELECT SUM(score_daily) FROM scores", fetch_mode=FetchMode.VAL)
 
-    async def update_users_score(self, user_id: int, delta: int, admin: bool = False):
-        await self.execute(
-            "INSERT INTO scores (id, score_total) VALUES ($1, $2) "
-            "ON CONFLICT (id) DO UPDATE SET score_total = scores.score_total + $2, left_server = false",
-            user_id,
-            delta,
-        )
-        if not admin and delta > 0:
-            await self.execute(
-                "UPDATE scores SET score_daily = score_daily + $1, score_weekly = score_weekly + $1 WHERE id = $2",
-                delta,
-                user_id,
-            )
+    async def update_users_score(self, user_id: int, delta: int, admin: bool = False) -> int:
+        """Returns member's new total score. Non-admin deltas are buffered and written by `flush_scores`"""
+        score = self._get_score(user_id)
+        score.total += delta
+        score.left_server = False
+        self._ranks.set(user_id, score.total)
+        if admin or delta <= 0:
+            await self.execute_statement(ADD_SCORE, user_id, delta)
+            return score.total
+
+        score.daily += delta
+        score.weekly += delta
+        self._score_buffer.add(user_id, delta)
+        if self._score_buffer.is_full():
+            await self.flush_scores()
+        return score.total
+
+    async def set_left_server(self, user_id: int, left: bool):
+        await self.execute("UPDATE scores SET left_server = $1 WHERE id = $2", left, user_id)
+        if user_id not in self._cache.scores:
+            return
+        score = self._cache.scores[user_id]
+        score.left_server = left
+        if left:
+            self._ranks.remove(user_id)
+        else:
+            self._ranks.set(user_id, score.total)
+
+    async def mark_left_members(self, ids: set[int]):
+        async with self._acquire() as con, self.metrics.time_query("mark_left_members"):
+            con: asyncpg.Connection
+            await con.executemany("UPDATE scores SET left_server = TRUE WHERE id = $1", [(i,) for i in ids])
+        for i in ids:
+            if i in self._cache.scores:
+                self._cache.scores[i].left_server = True
+            self._ranks.remove(i)
+
+    async def flush_scores(self):
+        deltas = self._score_buffer.drain()
+        try:
+            await self._write_score_deltas(self, deltas)
+        except Exception:
+            self._score_buffer.restore(deltas)
+            raise
+
+    @staticmethod
+    async def _write_score_deltas(executor: "Database | Transaction", deltas: dict[int, int]):
+        if len(deltas) == 0:
+            return
+        await executor.execute_statement(ADD_SCORE_DELTAS, list(deltas.keys()), list(deltas.values()))
 
     async def get_lb_position(self, score: int) -> int:
-        return await self.execute(
-            "SELECT COUNT(*) + 1 FROM scores WHERE score_total > $1 AND NOT left_server",
-            score,
-            fetch_mode=FetchMode.VAL,
-        )
+        return self._ranks.position(score)
 
-    async def get_top_data(self, page: int):
-        return await self.execute(
-            "SELECT id, score_total FROM scores WHERE NOT left_server ORDER BY score_total DESC LIMIT 10 OFFSET $1",
-            (page - 1) * 10,
-            fetch_mode=FetchMode.ALL,
-        )
+    async def get_top_data(self, page: int) -> list[tuple[int, int]]:
+        """Returns list of `(member_id, score_total)` tuples"""
+        return self._ranks.page((page - 1) * LEADERBOARD_PAGE_SIZE, LEADERBOARD_PAGE_SIZE)
+
+    async def get_leaderboard_version(self, page: int) -> int:
+        return self._ranks.page_version(page)
 
     async def add_level(self, role_id: int, required_score: int):
         await self.execute(
@@ -234,7 +504,7 @@ FROM warns WHERE target_id = $1",
             required_score,
             role_id,
         )
-        self._cache.level_roles.clear()
+        self.cache.invalidate("levels")
 
     @overload
     async def remove_level(self, role: disnake.Role):
@@ -263,23 +533,58 @@ FROM warns WHERE target_id = $1",
 
         if r is None:
             return None, None
-        self._cache.level_roles.clear()
+        self.cache.invalidate("levels")
         return r["role_id"], r["required_score"]
 
+    @cached("youtubers")
     async def get_youtubers(self) -> list[Youtuber]:
+        return await self.execute_statement(GET_YOUTUBERS, fetch_mode=FetchMode.ALL)
+
+    async def queue_youtube_announcements(self, last_videos: dict[int, str]):
+        """Saves new last videos of youtubers and queues them for announcement, a youtuber is queued only once"""
+        async with self.transaction() as tx:
+            await tx.execute(
+                "UPDATE youtubers SET last_video = v.last_video "
+                "FROM UNNEST($1::BIGINT[], $2::TEXT[]) AS v (id, last_video) WHERE youtubers.id = v.id",
+                list(last_videos.keys()),
+                list(last_videos.values()),
+            )
+            await tx.execute(
+                "INSERT INTO youtube_announcements (id, video_id) "
+                "SELECT v.id, v.video_id FROM UNNEST($1::BIGINT[], $2::TEXT[]) AS v (id, video_id) "
+                "JOIN youtubers ON youtubers.id = v.id "
+                "ON CONFLICT (id) DO UPDATE SET video_id = excluded.video_id",
+                list(last_videos.keys()),
+                list(last_videos.values()),
+            )
+        self.cache.invalidate("youtubers")
+
+    async def get_youtube_announcements(self) -> list[tuple[int, str]]:
         return [
-            Youtuber(*d.values())
-            for d in await self.execute(
-                "SELECT id, youtube_id, last_video FROM youtubers",
+            (r["id"], r["video_id"])
+            for r in await self.execute(
+                "SELECT id, video_id FROM youtube_announcements ORDER BY queued_at",
                 fetch_mode=FetchMode.ALL,
             )
         ]
 
-    async def set_youtuber_last_video(self, id: int, last_video: str):
-        await self.execute("UPDATE youtubers SET last_video = $1 WHERE id = $2", last_video, id)
+    async def announce_youtube_video(self, id: int, video_id: str, post: Callable[[], Awaitable[Any]]) -> bool:
+        """Dequeues the announcement and counts the advertisement in the transaction `post` is awaited in,
+        so a failed post leaves it queued. Returns False if the announcement is no longer queued"""
+        async with self.transaction() as tx:
+            dequeued = await tx.execute(
+                "DELETE FROM youtube_announcements WHERE id = $1 AND video_id = $2 RETURNING TRUE",
+                id,
+                video_id,
+                fetch_mode=FetchMode.VAL,
+            )
+            if not dequeued:
+                return False
+            await tx.execute("UPDATE youtubers SET times_advertised = times_advertised + 1 WHERE id = $1", id)
+            await post()
+        return True
 
-    async def add_youtuber(self, id: int, youtube_id: str, premium: bool):
-        last_video = await fetch_last_video(youtube_id)
+    async def add_youtuber(self, id: int, youtube_id: str, last_video: str, premium: bool):
         await self.execute(
             "INSERT INTO youtubers (id, youtube_id, last_video, is_premium) VALUES ($1, $2, $3, $4)",
             id,
@@ -287,14 +592,18 @@ FROM warns WHERE target_id = $1",
             last_video,
             premium,
         )
+        self.cache.invalidate("youtubers")
 
     async def remove_youtuber(self, id: int) -> bool:
-        return await self.execute(
+        removed = await self.execute(
             "WITH deleted AS (DELETE FROM youtubers WHERE id = $1 RETURNING *) SELECT COUNT(*) > 0 FROM deleted",
             id,
             fetch_mode=FetchMode.VAL,
         )
+        self.cache.invalidate("youtubers")
+        return removed
 
+    @cached("button_roles")
     async def get_button_roles(self) -> dict[str, int]:
         return {
             r["id"]: r["role_id"]
@@ -308,38 +617,129 @@ FROM warns WHERE target_id = $1",
             role_id,
             message_id,
         )
+        self.cache.invalidate("button_roles")
 
     async def remove_button_role(self, id: str):
         await self.execute("DELETE FROM button_roles WHERE id = $1", id)
+        self.cache.invalidate("button_roles")
 
     async def clear_button_roles(self, message_id: int):
-        await self.execute("DELETE FROM button_roles WHERE message_id = $1", message_id)
+        cleared = await self.execute(
+            "WITH deleted AS (DELETE FROM button_roles WHERE message_id = $1 RETURNING *) "
+            "SELECT COUNT(*) > 0 FROM deleted",
+            message_id,
+            fetch_mode=FetchMode.VAL,
+        )
+        if cleared:
+            self.cache.invalidate("button_roles")
+
+    @cached("rules")
+    async def get_rules(self) -> dict[str, str]:
+        return {
+            r["id"]: r["content"]
+            for r in await self.execute("SELECT id, content FROM rules ORDER BY id", fetch_mode=FetchMode.ALL)
+        }
 
     async def add_rule(self, id: str, content: str):
         await self.execute("INSERT INTO rules (id, content) VALUES ($1, $2)", id, content)
+        self.cache.invalidate("rules")
 
     async def remove_rule(self, id: str):
         await self.execute("DELETE FROM rules WHERE id = $1", id)
+        self.cache.invalidate("rules")
 
     async def add_tempban(self, id: int, unban_at: datetime):
         await self.execute("INSERT INTO bans (id, unban_at) VALUES ($1, $2)", id, unban_at)
+        self.expirations.schedule(unban_at, ExpirationType.BAN)
+
+    async def pop_expired_bans(self, now: datetime) -> list[int]:
+        return [
+            r["id"]
+            for r in await self.execute(
+                "DELETE FROM bans WHERE unban_at <= $1 RETURNING id", now, fetch_mode=FetchMode.ALL
+            )
+        ]
 
     async def remove_bans(self, id: int):
         await self.execute("DELETE FROM bans WHERE id = $1", id)
 
+    async def add_promocode(self, code: str, expires_at: date, unlocks_at: date):
+        await self.execute(
+            "INSERT INTO promocodes (code, expires_at, unlocks_at) VALUES ($1, $2, $3)",
+            code,
+            expires_at,
+            unlocks_at,
+        )
+        self.cache.invalidate("promocodes")
+
+    async def remove_promocode(self, code: str):
+        await self.execute("DELETE FROM promocodes WHERE code = $1", code)
+        self.cache.invalidate("promocodes")
+
+    @cached("promocodes")
+    async def _get_promocodes_matcher(self) -> re.Pattern | None:
+        """Returns a single pattern matching any of the promocodes or None if there are no promocodes"""
+        codes = [r["code"] for r in await self.execute("SELECT code FROM promocodes", fetch_mode=FetchMode.ALL)]
+        return re.compile("|".join(map(re.escape, codes))) if len(codes) > 0 else None
+
     async def promocodes_present(self) -> bool:
-        if self._promocodes_present is None:
-            self._promocodes_present = await self.execute(
-                "SELECT EXISTS(SELECT * FROM promocodes)", fetch_mode=FetchMode.VAL
-            )
-        return self._promocodes_present
+        return await self._get_promocodes_matcher() is not None
 
-    def invalidate_promocodes(self):
-        self._promocodes_present = None
+    async def find_promocode(self, text: str) -> str | None:
+        """Returns the first promocode contained in uppercase text"""
+        matcher = await self._get_promocodes_matcher()
+        if matcher is None:
+            return None
+        match = matcher.search(text)
+        return match.group() if match is not None else None
 
 
 class Cache:
-    level_roles: dict[int, int]
+    scores: dict[int, Score]
+    afks: dict[int, tuple[str, datetime]]
 
     def __init__(self):
-        self.level_roles = {}
+        self.scores = {}
+        self.afks = {}
+
+
+class Transaction:
+    """Statements of a `Database.transaction` block, all run on its connection"""
+
+    def __init__(self, log: Logger, metrics: DatabaseMetrics, con: asyncpg.Connection):
+        self.log = log
+        self.metrics = metrics
+        self.con = con
+
+    async def execute(
+        self, query: str, *args, fetch_mode: FetchMode = FetchMode.NONE
+    ) -> None | list[dict] | dict | Any:
+        with self.metrics.time_query(_caller_name()):
+            return await _fetch(self.log, self.con, query, args, fetch_mode)
+
+    async def execute_statement(
+        self, statement: Statement, *args, fetch_mode: FetchMode = FetchMode.NONE
+    ) -> None | list | Any:
+        with self.metrics.time_query(statement.name):
+            return await fetch_statement(self.con, statement, args, fetch_mode)
+
+
+def _caller_name() -> str:
+    """Name of the function calling the caller, so queries are named after the methods running them"""
+    return sys._getframe(2).f_code.co_name
+
+
+async def _fetch(
+    log: Logger, con: asyncpg.Connection, query: str, args: tuple, fetch_mode: FetchMode
+) -> None | list[dict] | dict | Any:
+    if query.upper().startswith("SELECT") and fetch_mode == FetchMode.NONE:
+        log.warning("Selection with no output. Query: %s", query)
+    match fetch_mode:  # noqa: E999
+        case FetchMode.NONE:
+            return await con.execute(query, *args)
+        case FetchMode.VAL:
+            return await con.fetchval(query, *args)
+        case FetchMode.ROW:
+            return await con.fetchrow(query, *args)
+        case FetchMode.ALL:
+            return await con.fetch(query, *args)
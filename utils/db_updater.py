@@ -1,9 +1,13 @@
+import time
+
 import asyncpg
 from exencolorlogs import Logger
 
 from utils.enums import FetchMode
 
-VERSION = 3
+VERSION = 7
+# tables whose changes are published on the table_changes channel, so other processes can invalidate caches
+NOTIFY_TABLES = ("levels", "rules", "promocodes", "button_roles")
 
 
 async def update_db(db):
@@ -12,11 +16,16 @@ async def update_db(db):
     _con: asyncpg.Connection = await db.pool.acquire()
     db_version = await db.execute("SELECT version FROM version", fetch_mode=FetchMode.VAL)
     log.info("DB version: %s | Required version: %s", db_version, VERSION)
+    start = time.perf_counter()
     try:
         while db_version < VERSION:
             db_version += 1
             log.info("Executing compatibility script #%s", db_version)
+            start = time.perf_counter()
             async with _con.transaction():
+                # locks the version row, a process starting at the same time waits and skips the applied scripts
+                if await _con.fetchval("SELECT version FROM version FOR UPDATE") >= db_version:
+                    continue
                 match db_version:  # noqa: E999
                     case 1:
                         await _con.execute("ALTER TABLE scores ADD COLUMN score_daily INT DEFAULT 0")
@@ -27,12 +36,56 @@ async def update_db(db):
                             "ALTER TABLE promocodes ADD COLUMN unlocks_at DATE NOT NULL DEFAULT CURRENT_DATE"
                         )
                         await _con.execute("ALTER TABLE promocodes ALTER COLUMN unlocks_at DROP DEFAULT")
+                    case 4:
+                        await _con.execute(
+                            "CREATE INDEX IF NOT EXISTS warns_target_id_idx ON warns (target_id, rule_violated)"
+                        )
+                        await _con.execute("CREATE INDEX IF NOT EXISTS warns_issued_at_idx ON warns (issued_at)")
+                        await _con.execute(
+                            "CREATE INDEX IF NOT EXISTS temproles_remove_at_idx ON temproles (remove_at)"
+                        )
+                        await _con.execute(
+                            "CREATE INDEX IF NOT EXISTS bans_unban_at_idx ON bans (unban_at) WHERE unban_at IS NOT NULL"
+                        )
+                        await _con.execute(
+                            "CREATE INDEX IF NOT EXISTS locked_channels_unlock_at_idx ON locked_channels (unlock_at) "
+                            "WHERE unlock_at IS NOT NULL"
+                        )
+                    case 5:
+                        await _con.execute("CREATE TABLE IF NOT EXISTS server_locked_channels (id BIGINT PRIMARY KEY)")
+                    case 6:
+                        await _con.execute(
+                            "CREATE TABLE IF NOT EXISTS youtube_announcements ("
+                            "id BIGINT PRIMARY KEY REFERENCES youtubers (id) ON DELETE CASCADE, "
+                            "video_id TEXT NOT NULL, "
+                            "queued_at TIMESTAMP NOT NULL DEFAULT NOW())"
+                        )
+                    case 7:
+                        await _con.execute(
+                            "CREATE OR REPLACE FUNCTION notify_table_change() RETURNS TRIGGER AS $$ "
+                            "BEGIN PERFORM pg_notify('table_changes', TG_TABLE_NAME); RETURN NULL; END "
+                            "$$ LANGUAGE plpgsql"
+                        )
+                        # creates the trigger only if it is missing, so starting several processes at once is safe
+                        await _con.execute(
+                            "CREATE OR REPLACE FUNCTION create_notify_trigger(tbl TEXT) RETURNS VOID AS $$ "
+                            "BEGIN IF NOT EXISTS (SELECT FROM pg_trigger "
+                            "WHERE tgname = tbl || '_notify' AND tgrelid = tbl::regclass) THEN "
+                            "EXECUTE format('CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE ON %I "
+                            "FOR EACH ROW EXECUTE FUNCTION notify_table_change()', tbl || '_notify', tbl); END IF; "
+                            "EXCEPTION WHEN duplicate_object THEN NULL; END "
+                            "$$ LANGUAGE plpgsql"
+                        )
+                        for table in NOTIFY_TABLES:
+                            await _con.execute("SELECT create_notify_trigger($1)", table)
 
                 # noinspection SqlWithoutWhere
                 await _con.execute("UPDATE version SET version = $1", db_version)
+            db.metrics.record("update_db", time.perf_counter() - start)
             log.ok("Compatibility script #%s was executed successfully", db_version)
         log.ok("Database is at latest version")
     except Exception as e:
+        db.metrics.record("update_db", time.perf_counter() - start, failed=True)
         log.error(
             "Failed to execute compatibility script %s, rolled back to %s",
             db_version,
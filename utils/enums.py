@@ -6,3 +6,9 @@ class FetchMode(Enum):
     VAL = 1
     ROW = 2
     ALL = 3
+
+
+class ExpirationType(Enum):
+    TEMPROLE = 0
+    BAN = 1
+    LOCKED_CHANNEL = 2
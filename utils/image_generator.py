@@ -1,14 +1,28 @@
 import asyncio
+import multiprocessing
 import os
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from io import BytesIO
+from itertools import accumulate
 from random import randint
-from urllib.request import build_opener, install_opener, urlretrieve
+from typing import TYPE_CHECKING, Any, Callable
 
 from disnake import Role, User
 from PIL import Image, ImageDraw, ImageFont
 
-from utils.bot import Bot
+from utils.constants import LEADERBOARD_CACHE_BYTES, RENDER_QUEUE_SIZE, RENDER_WORKERS
+
+if TYPE_CHECKING:
+    from utils.bot import Bot
+
+FONT_PATH = "res/orbitron.ttf"
+LEADERBOARD_TEMPLATE_PATH = "res/template.png"
+RANK_TEMPLATE_PATH = "res/rank_template.png"
+RANK_OVERLAY_PATH = "res/rank_template_transparent.png"
 
 BASE_COLOR = (0, 255, 234)
 PAGE_COLOR = (82, 206, 251)
@@ -18,6 +32,7 @@ PLACE_X = 18
 MEMBER_X = 138
 SCORE_X = 597
 FIRST_ROW_Y = 246
+MEMBER_NAME_MAX_WIDTH = 430
 PAGE_TXT_POSITION = (24, 1161)
 
 MEMBER_COLOR = (0, 251, 255)
@@ -34,14 +49,185 @@ SQUARE_TOP_Y = 297.5
 SQUARE_BOTTOM_Y = 378.5
 SQUARE_SIZE = 54.19
 SQUARE_STEP = 77.41
+AVATAR_SIZE = (221, 221)
+AVATAR_CACHE_SIZE = 128
+
+
+class Assets:
+    """Templates and font decoded once, templates are handed out as copies"""
+
+    def __init__(self):
+        self._images: dict[str, Image.Image] = {}
+        self._font_data: bytes | None = None
+
+    def load(self):
+        for path in (LEADERBOARD_TEMPLATE_PATH, RANK_TEMPLATE_PATH, RANK_OVERLAY_PATH):
+            self.image(path)
+        self.font_data()
+
+    def image(self, path: str) -> Image.Image:
+        """Returns shared decoded image, it must not be modified"""
+        if path not in self._images:
+            image = Image.open(path)
+            image.load()
+            self._images[path] = image
+        return self._images[path]
+
+    def template(self, path: str) -> Image.Image:
+        return self.image(path).copy()
+
+    def font_data(self) -> bytes:
+        if self._font_data is None:
+            with open(FONT_PATH, "rb") as f:
+                self._font_data = f.read()
+        return self._font_data
 
-request_opener = build_opener()
-request_opener.addheaders = [("Authorization", f"Bot {os.getenv('TOKEN')}")]
-install_opener(request_opener)
 
+assets = Assets()
 
+
+@lru_cache(maxsize=None)
 def get_font(size):
-    return ImageFont.truetype("res/orbitron.ttf", size=size)
+    return ImageFont.truetype(BytesIO(assets.font_data()), size=size)
+
+
+class TextFitter:
+    """Truncates text to a pixel width.
+
+    The cut is estimated with cached per-glyph advances of the font, then the result is measured with its bounding
+    box, which also accounts for glyph bearings, and shortened while it overflows.
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont, ellipsis: str = "..."):
+        self.font = font
+        self.ellipsis = ellipsis
+        self._advances: dict[str, float] = {}
+
+    def _advance(self, char: str) -> float:
+        if char not in self._advances:
+            self._advances[char] = self.font.getlength(char)
+        return self._advances[char]
+
+    def _width(self, text: str) -> int:
+        left, _, right, _ = self.font.getbbox(text)
+        return right - left
+
+    def fit(self, text: str, max_width: float) -> str:
+        if len(text) == 0 or self._width(text) <= max_width:
+            return text
+        widths = list(accumulate(map(self._advance, text)))
+        ellipsis_width = sum(map(self._advance, self.ellipsis))
+        end = bisect_right(widths, max_width - ellipsis_width)
+        while end > 0 and self._width(text[:end] + self.ellipsis) > max_width:
+            end -= 1
+        return text[:end] + self.ellipsis
+
+
+@lru_cache(maxsize=None)
+def get_text_fitter(size: int) -> TextFitter:
+    return TextFitter(get_font(size))
+
+
+@lru_cache(maxsize=4096)
+def fit_member_name(member_id: int, name: str) -> str:
+    """Memoized per member and name, so repeated leaderboards skip the text layout"""
+    return get_text_fitter(45).fit(name, MEMBER_NAME_MAX_WIDTH)
+
+
+def _init_worker():
+    assets.load()
+    for size in (40, 45, 55, 60, 95):
+        get_font(size)
+
+
+class Renderer:
+    """Runs image rendering in worker processes, so it does not hold the GIL of the event loop.
+
+    At most `queue_size` jobs are submitted at once, other callers wait for a free slot.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self._slots = asyncio.Semaphore(queue_size)
+        self._executor: ProcessPoolExecutor | None = None
+
+    def start(self):
+        self._executor = ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+
+renderer = Renderer(RENDER_WORKERS, RENDER_QUEUE_SIZE)
+
+
+class AvatarCache:
+    """LRU cache of avatars decoded and resized for rank cards, keyed by avatar hash"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._avatars: OrderedDict[str, Image.Image] = OrderedDict()
+
+    async def get(self, member: User) -> Image.Image:
+        asset = member.display_avatar
+        if asset.key in self._avatars:
+            self._avatars.move_to_end(asset.key)
+            return self._avatars[asset.key]
+
+        data = await asset.with_format("png").with_size(256).read()
+        avatar = await renderer.run(_decode_avatar, data)
+        self._avatars[asset.key] = avatar
+        while len(self._avatars) > self.max_size:
+            self._avatars.popitem(last=False)
+        return avatar
+
+
+def _decode_avatar(data: bytes) -> Image.Image:
+    return Image.open(BytesIO(data)).resize(AVATAR_SIZE)
+
+
+avatars = AvatarCache(AVATAR_CACHE_SIZE)
+
+
+class LeaderboardCache:
+    """LRU cache of encoded leaderboard pages keyed by page and its version, bounded by total size in bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._pages: OrderedDict[int, tuple[int, bytes]] = OrderedDict()
+        self._size = 0
+
+    def get(self, page: int, version: int) -> bytes | None:
+        entry = self._pages.get(page)
+        if entry is None or entry[0] != version:
+            return None
+        self._pages.move_to_end(page)
+        return entry[1]
+
+    def put(self, page: int, version: int, data: bytes):
+        self._discard(page)
+        self._pages[page] = (version, data)
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            self._discard(next(iter(self._pages)))
+
+    def _discard(self, page: int):
+        entry = self._pages.pop(page, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+
+leaderboards = LeaderboardCache(LEADERBOARD_CACHE_BYTES)
 
 
 def generate_id():
@@ -49,40 +235,40 @@ def generate_id():
 
 
 async def resize_bg(bg_path: str):
-    await asyncio.get_event_loop().run_in_executor(None, _resize_bg, bg_path)
+    await renderer.run(_resize_bg, bg_path)
 
 
 def _resize_bg(bg_path: str):
-    Image.open(bg_path).resize(Image.open("res/rank_template.png").size).save(bg_path)
+    Image.open(bg_path).resize(assets.image(RANK_TEMPLATE_PATH).size).save(bg_path)
 
 
-async def draw_leaderboard(bot: Bot, page: int) -> BytesIO:
-    return await asyncio.get_event_loop().run_in_executor(
-        None, _draw_leaderboard, bot, page, await bot.db.get_top_data(page)
-    )
+async def draw_leaderboard(bot: "Bot", page: int) -> BytesIO:
+    version = await bot.db.get_leaderboard_version(page)
+    data = leaderboards.get(page, version)
+    if data is None:
+        rows = [
+            (member_id, str(bot.get_user(member_id)), score) for member_id, score in await bot.db.get_top_data(page)
+        ]
+        data = await renderer.run(_draw_leaderboard, page, rows)
+        leaderboards.put(page, version, data)
+    return BytesIO(data)
 
 
-def _draw_leaderboard(bot: Bot, page: int, top_data) -> BytesIO:
-    img = Image.open("res/template.png")
+def _draw_leaderboard(page: int, rows: list[tuple[int, str, int]]) -> bytes:
+    img = assets.template(LEADERBOARD_TEMPLATE_PATH)
     draw = ImageDraw.Draw(img)
     font = get_font(45)
     page_font = get_font(60)
-    for pos, entry in enumerate(top_data):
+    for pos, (member_id, member_name, score) in enumerate(rows):
         y_pos = FIRST_ROW_Y + 90 * pos
         if y_pos > 1070:
             break
-        member = bot.get_user(entry["id"])
-        member_name = str(member)
-        while draw.textsize(member_name, font=get_font(45))[0] > 430:
-            if member_name.endswith("..."):
-                member_name = member_name[:-4] + "..."
-            else:
-                member_name = member_name[:-1] + "..."
+        member_name = fit_member_name(member_id, member_name)
         draw.text((PLACE_X, y_pos), text=str(pos), fill=BASE_COLOR, font=font, anchor="ls")
         draw.text((MEMBER_X, y_pos), text=member_name, fill=BASE_COLOR, font=font, anchor="ls")
         draw.text(
             (SCORE_X, y_pos),
-            text=number_to_numstring(entry["score_total"]),
+            text=number_to_numstring(score),
             fill=BASE_COLOR,
             font=font,
             anchor="ls",
@@ -97,8 +283,7 @@ def _draw_leaderboard(bot: Bot, page: int, top_data) -> BytesIO:
     )
     bi = BytesIO()
     img.save(bi, "PNG")
-    bi.seek(0)
-    return bi
+    return bi.getvalue()
 
 
 async def draw_rank_card(
@@ -108,39 +293,44 @@ async def draw_rank_card(
     current_score: int,
     score_to_next_role: int = None,
 ) -> BytesIO:
-    return await asyncio.get_running_loop().run_in_executor(
-        None,
-        _draw_rank_card,
-        member,
-        position,
-        next_role,
-        current_score,
-        score_to_next_role,
+    if not next_role:
+        next_role_name = "All roles obtained!"
+        next_role_color = WHITE
+    else:
+        next_role_name = next_role.name
+        next_role_color = next_role.color.to_rgb()
+    return BytesIO(
+        await renderer.run(
+            _draw_rank_card,
+            member.id,
+            str(member),
+            await avatars.get(member),
+            position,
+            next_role_name,
+            next_role_color,
+            current_score,
+            score_to_next_role,
+        )
     )
 
 
 def _draw_rank_card(
-    member: User,
+    member_id: int,
+    member_name: str,
+    avatar: Image.Image,
     position: int,
-    next_role: Role | None,
+    next_role_name: str,
+    next_role_color: tuple[int, int, int],
     current_score: int,
     score_to_next_role: int | None = None,
-) -> BytesIO:
-    if not next_role:
-        next_role_name = "All roles obtained!"
-        next_role_color = WHITE
-    else:
-        next_role_name = next_role.name
-        next_role_color = next_role.color.to_rgb()
-    urlretrieve(str(member.display_avatar.url)[:-3] + "png", "avatar.png")
-    custom_bg_path = f"backgrounds/{member.id}.png"
+) -> bytes:
+    custom_bg_path = f"backgrounds/{member_id}.png"
     if not os.path.exists(custom_bg_path):
-        template = Image.open("res/rank_template.png")
+        template = assets.template(RANK_TEMPLATE_PATH)
     else:
         template = Image.open(custom_bg_path)
-        pasted_image = Image.open("res/rank_template_transparent.png")
-        template.paste(pasted_image, mask=pasted_image)
-    avatar = Image.open("avatar.png").resize((221, 221))
+        overlay = assets.image(RANK_OVERLAY_PATH)
+        template.paste(overlay, mask=overlay)
     draw = ImageDraw.Draw(template)
 
     member_font = get_font(40)
@@ -150,7 +340,7 @@ def _draw_rank_card(
     template.paste(avatar, PFP_POSITION)
     draw.text(
         MEMBER_NAME_POSITION,
-        str(member),
+        member_name,
         fill=MEMBER_COLOR,
         font=member_font,
         anchor="ls",
@@ -187,8 +377,7 @@ def _draw_rank_card(
 
     bi = BytesIO()
     template.save(bi, "PNG")
-    bi.seek(0)
-    return bi
+    return bi.getvalue()
 
 
 def number_to_numstring(num):
@@ -0,0 +1,105 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable
+
+import asyncpg
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Latency histogram with fixed bucket bounds in seconds, the last bucket counts everything above them"""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket the quantile falls into, infinity if it is above all buckets"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self, name: str, labels: str = "") -> list[str]:
+        sep = "," if labels else ""
+        lines = []
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {seen}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class DatabaseMetrics:
+    def __init__(self):
+        self.queries: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.errors: defaultdict[str, int] = defaultdict(int)
+        self.acquire = Histogram()
+
+    def record(self, name: str, seconds: float, failed: bool = False):
+        self.queries[name].observe(seconds)
+        if failed:
+            self.errors[name] += 1
+
+    @contextmanager
+    def time_query(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.record(name, time.perf_counter() - start, failed=True)
+            raise
+        self.record(name, time.perf_counter() - start)
+
+    def render(self, pool: asyncpg.Pool) -> list[str]:
+        lines = [
+            "# TYPE db_query_seconds histogram",
+            *[
+                line
+                for name, h in sorted(self.queries.items())
+                for line in h.render("db_query_seconds", f'query="{name}"')
+            ],
+            "# TYPE db_query_errors_total counter",
+            *[f'db_query_errors_total{{query="{name}"}} {count}' for name, count in sorted(self.errors.items())],
+            "# TYPE db_pool_acquire_seconds histogram",
+            *self.acquire.render("db_pool_acquire_seconds"),
+        ]
+        size, idle = pool.get_size(), pool.get_idle_size()
+        lines += [
+            "# TYPE db_pool_connections gauge",
+            f'db_pool_connections{{state="in_use"}} {size - idle}',
+            f'db_pool_connections{{state="idle"}} {idle}',
+            f"db_pool_max_size {pool.get_max_size()}",
+        ]
+        return lines
+
+
+async def start_metrics_server(render: Callable[[], list[str]], port: int) -> web.AppRunner:
+    """Serves metrics in the Prometheus text format on `/metrics`"""
+
+    async def handler(_: web.Request) -> web.Response:
+        return web.Response(text="\n".join(render()) + "\n", content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    return runner
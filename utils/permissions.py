@@ -0,0 +1,46 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+import disnake
+
+from utils.constants import BULK_EDIT_CONCURRENCY, BULK_EDIT_PROGRESS_INTERVAL_SECONDS
+
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+async def bulk_set_send_messages(
+    channels: list[disnake.abc.GuildChannel],
+    target: disnake.Role | disnake.Member,
+    send_messages: bool | None,
+    reason: str,
+    on_progress: ProgressCallback | None = None,
+) -> list[disnake.abc.GuildChannel]:
+    """Edits `send_messages` overwrite of the target in all channels concurrently and returns channels that were edited.
+
+    Every channel has its own rate limit bucket for overwrite edits, which disnake's HTTP client tracks and waits for,
+    so the amount of simultaneous requests is only capped to stay under the global rate limit.
+    `on_progress(done, total)` is called at most once per `BULK_EDIT_PROGRESS_INTERVAL_SECONDS`.
+    """
+    semaphore = asyncio.Semaphore(BULK_EDIT_CONCURRENCY)
+    edited: list[disnake.abc.GuildChannel] = []
+    done = 0
+    last_report = time.monotonic()
+
+    async def edit(channel: disnake.abc.GuildChannel):
+        nonlocal done, last_report
+        overwrite = channel.overwrites_for(target)
+        overwrite.send_messages = send_messages
+        async with semaphore:
+            try:
+                await channel.set_permissions(target, overwrite=overwrite, reason=reason)
+                edited.append(channel)
+            except disnake.HTTPException:
+                pass
+        done += 1
+        if on_progress is not None and time.monotonic() - last_report >= BULK_EDIT_PROGRESS_INTERVAL_SECONDS:
+            last_report = time.monotonic()
+            await on_progress(done, len(channels))
+
+    await asyncio.gather(*[edit(c) for c in channels])
+    return edited
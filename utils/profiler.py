@@ -0,0 +1,123 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from functools import wraps
+from typing import Awaitable, Callable
+
+from exencolorlogs import Logger
+
+
+class RollingStats:
+    """Durations of the last `size` calls"""
+
+    def __init__(self, size: int):
+        self.count = 0
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        if len(self._samples) == 0:
+            return 0.0
+        samples = sorted(self._samples)
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class HandlerProfiler:
+    """Times listeners, message stages and slash commands by name"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.stats: defaultdict[str, RollingStats] = defaultdict(lambda: RollingStats(self.window))
+
+    def record(self, name: str, seconds: float):
+        self.stats[name].record(seconds)
+
+    def wrap(self, name: str, func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    def render(self) -> list[str]:
+        lines = ["# TYPE handler_seconds summary"]
+        for name, stats in sorted(self.stats.items()):
+            lines += [
+                f'handler_seconds{{handler="{name}",quantile="0.5"}} {stats.quantile(0.5)}',
+                f'handler_seconds{{handler="{name}",quantile="0.99"}} {stats.quantile(0.99)}',
+                f'handler_seconds_count{{handler="{name}"}} {stats.count}',
+            ]
+        return lines
+
+
+class LoopMonitor:
+    """Samples event loop lag with a task sleeping for `interval`.
+
+    A watchdog thread checks that the task keeps running, when it doesn't for longer than `stall_threshold`
+    the stack of the loop thread is logged once per stall, which shows what is blocking the loop.
+    """
+
+    def __init__(self, interval: float, stall_threshold: float, window: int):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.lag = RollingStats(window)
+        self.stalls = 0
+        self.log = Logger("LOOP")
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag.record(max(loop.time() - start - self.interval, 0.0))
+            self._heartbeat = time.monotonic()
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.interval
+            if stalled_for < self.stall_threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "unavailable"
+            self.log.warning("Event loop is blocked for %.2fs, stack of the loop thread:\n%s", stalled_for, stack)
+
+    def render(self) -> list[str]:
+        return [
+            "# TYPE loop_lag_seconds summary",
+            f'loop_lag_seconds{{quantile="0.5"}} {self.lag.quantile(0.5)}',
+            f'loop_lag_seconds{{quantile="0.99"}} {self.lag.quantile(0.99)}',
+            f"loop_lag_seconds_count {self.lag.count}",
+            "# TYPE loop_stalls_total counter",
+            f"loop_stalls_total {self.stalls}",
+        ]
@@ -0,0 +1,157 @@
+from bisect import bisect_left, insort
+
+_LOAD = 512
+
+
+class RankIndex:
+    """Order-statistics index of members by score, highest first.
+
+    Entries are kept as `(-score, member_id)` keys in a list of sorted chunks, with a Fenwick tree over
+    chunk sizes, so lookups of a position or of a page are logarithmic in the amount of members.
+    Every page has a version that is bumped only when the entries shown on it change.
+    """
+
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+        self._scores: dict[int, int] = {}
+        self._chunks: list[list[tuple[int, int]]] = []
+        self._maxes: list[tuple[int, int]] = []
+        self._tree: list[int] = [0]
+        self._page_versions: list[int] = []
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, member_id: int):
+        return member_id in self._scores
+
+    def load(self, scores: dict[int, int]):
+        self._scores = dict(scores)
+        keys = sorted((-score, member_id) for member_id, score in self._scores.items())
+        self._chunks = [keys[i : i + _LOAD] for i in range(0, len(keys), _LOAD)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._build_tree()
+        self._page_versions = [v + 1 for v in self._page_versions]
+
+    def set(self, member_id: int, score: int):
+        old_score = self._scores.get(member_id)
+        if old_score == score:
+            return
+        if old_score is not None:
+            old_pos = self._count_before((-old_score, member_id))
+            self._remove_key((-old_score, member_id))
+        self._scores[member_id] = score
+        self._insert_key((-score, member_id))
+        new_pos = self._count_before((-score, member_id))
+        if old_score is None:
+            self._bump_pages(new_pos, len(self) - 1)
+        else:
+            self._bump_pages(min(old_pos, new_pos), max(old_pos, new_pos))
+
+    def remove(self, member_id: int):
+        score = self._scores.pop(member_id, None)
+        if score is not None:
+            pos = self._count_before((-score, member_id))
+            self._remove_key((-score, member_id))
+            self._bump_pages(pos, len(self))
+
+    def page_version(self, page: int) -> int:
+        return self._page_versions[page - 1] if 0 < page <= len(self._page_versions) else 0
+
+    def position(self, score: int) -> int:
+        """Leaderboard position a member with the given score has, ties share the position"""
+        return self._count_before((-score, -1)) + 1
+
+    def page(self, offset: int, limit: int) -> list[tuple[int, int]]:
+        """Returns list of `(member_id, score)` tuples"""
+        if offset < 0 or offset >= len(self) or limit <= 0:
+            return []
+        i, j = self._locate(offset)
+        result = []
+        while i < len(self._chunks) and len(result) < limit:
+            for score, member_id in self._chunks[i][j : j + limit - len(result)]:
+                result.append((member_id, -score))
+            i, j = i + 1, 0
+        return result
+
+    def _bump_pages(self, first_pos: int, last_pos: int):
+        first_page, last_page = first_pos // self.page_size, last_pos // self.page_size
+        if last_page >= len(self._page_versions):
+            self._page_versions.extend([0] * (last_page + 1 - len(self._page_versions)))
+        for page in range(first_page, last_page + 1):
+            self._page_versions[page] += 1
+
+    def _build_tree(self):
+        tree = [0] + [len(chunk) for chunk in self._chunks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, i: int, delta: int):
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        """Sum of sizes of the first `i` chunks"""
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, pos: int) -> tuple[int, int]:
+        """Translates a global position into `(chunk index, index inside the chunk)`"""
+        i = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step > 0:
+            if i + step < len(self._tree) and self._tree[i + step] <= pos:
+                i += step
+                pos -= self._tree[i]
+            step >>= 1
+        return i, pos
+
+    def _count_before(self, key: tuple[int, int]) -> int:
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return len(self)
+        return self._prefix(i) + bisect_left(self._chunks[i], key)
+
+    def _insert_key(self, key: tuple[int, int]):
+        if len(self._chunks) == 0:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            self._build_tree()
+            return
+
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            self._chunks[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._chunks[i], key)
+        self._tree_add(i, 1)
+
+        chunk = self._chunks[i]
+        if len(chunk) > 2 * _LOAD:
+            self._chunks.insert(i + 1, chunk[_LOAD:])
+            self._maxes.insert(i + 1, chunk[-1])
+            del chunk[_LOAD:]
+            self._maxes[i] = chunk[-1]
+            self._build_tree()
+
+    def _remove_key(self, key: tuple[int, int]):
+        i = bisect_left(self._maxes, key)
+        chunk = self._chunks[i]
+        del chunk[bisect_left(chunk, key)]
+        if len(chunk) == 0:
+            del self._chunks[i]
+            del self._maxes[i]
+            self._build_tree()
+        else:
+            self._maxes[i] = chunk[-1]
+            self._tree_add(i, -1)
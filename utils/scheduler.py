@@ -0,0 +1,80 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from itertools import count
+from typing import Awaitable, Callable
+
+from exencolorlogs import Logger
+
+from utils.enums import ExpirationType
+
+RETRY_DELAY = timedelta(minutes=1)
+
+ExpirationHandler = Callable[[datetime], Awaitable[None]]
+
+
+class ExpirationScheduler:
+    """Wakes up exactly when the earliest scheduled expiration is due and calls the handler of its type.
+
+    Handlers receive the current time and are expected to process everything of their type that expired by then,
+    so entries for rows that were already removed simply result in a handler call with nothing to do.
+    """
+
+    def __init__(self):
+        self.log = Logger("SCHEDULER")
+        self._heap: list[tuple[datetime, int, ExpirationType]] = []
+        self._counter = count()
+        self._handlers: dict[ExpirationType, ExpirationHandler] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def add_handler(self, type: ExpirationType, handler: ExpirationHandler):
+        self._handlers[type] = handler
+
+    def schedule(self, when: datetime, type: ExpirationType):
+        heapq.heappush(self._heap, (when, next(self._counter), type))
+        if self._heap[0][0] == when:
+            self._wakeup.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            if len(self._heap) == 0:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            delay = (self._heap[0][0] - datetime.now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            now = datetime.now()
+            due: set[ExpirationType] = set()
+            while len(self._heap) > 0 and self._heap[0][0] <= now:
+                due.add(heapq.heappop(self._heap)[2])
+            for type in due:
+                await self._handle(type, now)
+
+    async def _handle(self, type: ExpirationType, now: datetime):
+        handler = self._handlers.get(type)
+        if handler is None:
+            self.log.warning("No handler registered for %s, retrying later", type.name)
+            self.schedule(now + RETRY_DELAY, type)
+            return
+        try:
+            await handler(now)
+        except Exception as e:
+            self.log.error("Failed to handle %s expirations, retrying later", type.name, exc_info=e)
+            self.schedule(now + RETRY_DELAY, type)
@@ -0,0 +1,26 @@
+class ScoreBuffer:
+    """Accumulates score deltas per member until they are flushed to the database in a single statement"""
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self._deltas: dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def add(self, user_id: int, delta: int):
+        self._deltas[user_id] = self._deltas.get(user_id, 0) + delta
+
+    def get(self, user_id: int) -> int:
+        return self._deltas.get(user_id, 0)
+
+    def is_full(self) -> bool:
+        return len(self._deltas) >= self.threshold
+
+    def drain(self) -> dict[int, int]:
+        deltas, self._deltas = self._deltas, {}
+        return deltas
+
+    def restore(self, deltas: dict[int, int]):
+        for user_id, delta in deltas.items():
+            self.add(user_id, delta)
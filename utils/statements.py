@@ -0,0 +1,60 @@
+from dataclasses import dataclass, fields
+from typing import Any
+
+import asyncpg
+
+from utils.enums import FetchMode
+
+
+@dataclass(frozen=True, slots=True)
+class Statement:
+    """Named query with an optional row type. Rows of statements with `row_type` are decoded into it,
+    so its fields must match the selected columns in order.
+
+    Queries are prepared once per connection by the statement cache of asyncpg, which is keyed by query text.
+    """
+
+    name: str
+    query: str
+    row_type: type | None = None
+
+
+_checked: set[str] = set()
+
+
+def _check_columns(statement: Statement, record: asyncpg.Record):
+    """Checks the columns of the first row a statement returns against its row type"""
+    if statement.name in _checked:
+        return
+    columns = tuple(record.keys())
+    expected = tuple(f.name for f in fields(statement.row_type))
+    if columns != expected:
+        raise TypeError(
+            f"Statement {statement.name} selects {columns}, but {statement.row_type.__name__} expects {expected}"
+        )
+    _checked.add(statement.name)
+
+
+def _decode(statement: Statement, record: asyncpg.Record) -> Any:
+    _check_columns(statement, record)
+    return statement.row_type(*record)
+
+
+async def fetch_statement(
+    con: asyncpg.Connection, statement: Statement, args: tuple, fetch_mode: FetchMode
+) -> None | list | Any:
+    match fetch_mode:  # noqa: E999
+        case FetchMode.NONE:
+            await con.execute(statement.query, *args)
+        case FetchMode.VAL:
+            return await con.fetchval(statement.query, *args)
+        case FetchMode.ROW:
+            r = await con.fetchrow(statement.query, *args)
+            if r is None or statement.row_type is None:
+                return r
+            return _decode(statement, r)
+        case FetchMode.ALL:
+            rows = await con.fetch(statement.query, *args)
+            if statement.row_type is None:
+                return rows
+            return [_decode(statement, r) for r in rows]
@@ -240,14 +240,7 @@ class PromocodeView(disnake.ui.View):
             )
             return
 
-        weekly_score: int = (
-            await self.bot.db.execute(
-                "SELECT score_weekly FROM scores WHERE id = $1",
-                inter.author.id,
-                fetch_mode=FetchMode.VAL,
-            )
-            or 0
-        )
+        weekly_score = await self.bot.db.get_users_weekly_score(inter.author.id)
         if weekly_score < PROMOCODE_REQUIRED_SCORE:
             await inter.send(
                 f"You need **{PROMOCODE_REQUIRED_SCORE:,}** weekly score to claim the promocode! "
@@ -1,28 +1,100 @@
+import asyncio
 import os
+from xml.etree.ElementTree import ParseError, XMLPullParser
 
 import aiohttp
 
 from utils.errors import YoutubeFetchFailure
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+ACTIVITIES_URL = "https://www.googleapis.com/youtube/v3/activities"
+# "api" uses the quota-metered Data API, "feed" reads public channel feeds and falls back to the API on failure
+YOUTUBE_BACKEND = os.getenv("YOUTUBE_BACKEND", "api")
+FEED_URL = os.getenv("YOUTUBE_FEED_URL", "https://www.youtube.com/feeds/videos.xml")
+VIDEO_ID_TAG = "{http://www.youtube.com/xml/schemas/2015}videoId"
 
 
-async def fetch_last_video(youtube_id: str) -> str:
-    async with aiohttp.ClientSession() as session:
-        r = await session.get(
-            "https://www.googleapis.com/youtube/v3/activities",
-            params={
-                "key": GOOGLE_API_KEY,
-                "part": "contentDetails",
-                "channelId": youtube_id,
-                "maxResults": 1,
-            },
-        )
-        if r.status == 200:
+class YoutubeClient:
+    """Long-lived YouTube client reusing pooled keep-alive connections.
+
+    Requests are conditional on the ETag of the previous response, so unchanged channels are answered with 304.
+    """
+
+    def __init__(self, connections: int = 10, backend: str = YOUTUBE_BACKEND):
+        if backend not in ("api", "feed"):
+            raise ValueError(f"Unknown youtube backend {backend!r}")
+        self.connections = connections
+        self.backend = backend
+        self._session: aiohttp.ClientSession | None = None
+        self._etags: dict[str, tuple[str, str]] = {}  # youtube_id: (etag, video_id)
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=600),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def fetch_last_video(self, youtube_id: str) -> str:
+        if self.backend == "feed":
             try:
+                return await self.fetch_last_video_from_feed(youtube_id)
+            except YoutubeFetchFailure:
+                pass
+        return await self.fetch_last_video_from_api(youtube_id)
+
+    async def fetch_last_video_from_feed(self, youtube_id: str) -> str:
+        """Reads the channel feed until the first entry, newest videos come first"""
+        parser = XMLPullParser(events=("end",))
+        try:
+            async with self.session.get(FEED_URL, params={"channel_id": youtube_id}) as r:
+                if r.status != 200:
+                    raise YoutubeFetchFailure(youtube_id)
+                async for chunk in r.content.iter_chunked(4096):
+                    parser.feed(chunk)
+                    for _, element in parser.read_events():
+                        if element.tag == VIDEO_ID_TAG and element.text:
+                            return element.text
+        except (aiohttp.ClientError, asyncio.TimeoutError, ParseError):
+            raise YoutubeFetchFailure(youtube_id)
+        raise YoutubeFetchFailure(youtube_id)
+
+    async def fetch_last_video_from_api(self, youtube_id: str) -> str:
+        headers = {}
+        cached = self._etags.get(youtube_id)
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+
+        try:
+            async with self.session.get(
+                ACTIVITIES_URL,
+                params={
+                    "key": GOOGLE_API_KEY,
+                    "part": "contentDetails",
+                    "channelId": youtube_id,
+                    "maxResults": 1,
+                },
+                headers=headers,
+            ) as r:
+                if r.status == 304 and cached is not None:
+                    return cached[1]
+                if r.status != 200:
+                    raise YoutubeFetchFailure(youtube_id)
                 data = await r.json()
-                return data["items"][0]["contentDetails"]["upload"]["videoId"]
-            except KeyError:
-                raise YoutubeFetchFailure(youtube_id)
-        else:
+                etag = r.headers.get("ETag")
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            raise YoutubeFetchFailure(youtube_id)
+
+        try:
+            video_id = data["items"][0]["contentDetails"]["upload"]["videoId"]
+        except (KeyError, IndexError):
             raise YoutubeFetchFailure(youtube_id)
+        if etag is not None:
+            self._etags[youtube_id] = (etag, video_id)
+        return video_id